@@ -1,8 +1,22 @@
 import struct
 import os
+import sys
 import zlib
-import io
+import mmap
+import stat
+import json
+import shutil
+import time
 import hashlib
+import argparse
+import posixpath
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
 
 # Constant for magic header verification
 MAGIC_HEADER = 0x73657250
@@ -12,6 +26,949 @@ BLZ4_HEADER = 0x347a6c62
 # Get the directory of the script. idk why i did this. but yeah... cool
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
+# raw_offset (4), size (4), offset_name (4), chunk_name (4), padding (12), unpack_size (4)
+FILESET_STRUCT = struct.Struct('<I I I I 12x I')
+
+# address_mode -> multiplier applied to the trimmed offset (RDP offsets are stored in 0x800 sectors)
+OFFSET_SCALES = {0xC0: 1, 0xD0: 1, 0x40: 0x800, 0x50: 0x800, 0x60: 0x800}
+SKIP_REASONS = {0x00: "Unknown address mode (0x00)", 0x30: "DataSet file (0x30)"}
+RDP_FILES = {0x40: 'package.rdp', 0x50: 'data.rdp', 0x60: 'patch.rdp'}
+
+
+def decode_fileset_table(file_data, fileset_start, count):
+    # Decodes a whole fileset table in one pass instead of unpacking entry by entry.
+    # Every value comes back as a column (list), index i of each column belongs to fileset i.
+    # count gets clamped to whatever actually fits in file_data.
+    with memoryview(file_data) as view:
+        count = max(0, min(count, (len(view) - fileset_start) // FILESET_STRUCT.size))
+        with view[fileset_start:fileset_start + count * FILESET_STRUCT.size] as table:
+            rows = list(FILESET_STRUCT.iter_unpack(table))
+    if rows:
+        raw_offsets, sizes, offset_names, chunk_names, unpack_sizes = map(list, zip(*rows))
+    else:
+        raw_offsets, sizes, offset_names, chunk_names, unpack_sizes = [], [], [], [], []
+
+    address_modes = [raw_offset >> 24 for raw_offset in raw_offsets]
+    real_offsets = [
+        (raw_offset & 0x00FFFFFF) * OFFSET_SCALES[mode] if mode in OFFSET_SCALES else None
+        for raw_offset, mode in zip(raw_offsets, address_modes)
+    ]
+    dummies = [
+        raw_offset == 0 and size == 0 and offset_name == 0 and chunk_name == 0 and unpack_size != 0
+        for raw_offset, size, offset_name, chunk_name, unpack_size in rows
+    ]
+    skip_reasons = [
+        "Dummy fileset" if dummy else SKIP_REASONS.get(mode)
+        for dummy, mode in zip(dummies, address_modes)
+    ]
+    return {
+        'count': count,
+        'raw_offset': raw_offsets,
+        'size': sizes,
+        'offset_name': offset_names,
+        'chunk_name': chunk_names,
+        'unpack_size': unpack_sizes,
+        'address_mode': address_modes,
+        'real_offset': real_offsets,
+        'dummy': dummies,
+        'skip_reason': skip_reasons,
+    }
+
+class ArchiveReader:
+    # Memory maps a .res/.rtbl instead of read()ing the whole thing, so only the pages parsing
+    # actually touches end up in memory. `data` is the mmap itself (find() and struct.unpack_from work
+    # on it straight away, the TOC parsers read it in place without slicing copies out of it).
+    # A nested archive that's already in memory (just decompressed) can be passed as data instead.
+    def __init__(self, file_path, data=None):
+        self.file_path = file_path
+        self.file = None
+        self.mmap = None
+        if data is not None:
+            self.data = data
+            return
+        self.file = open(file_path, 'rb')
+        if os.fstat(self.file.fileno()).st_size > 0: # empty files can't be mapped
+            self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.data = self.mmap if self.mmap is not None else b''
+
+    def __len__(self):
+        return len(self.data)
+
+    def close(self):
+        self.data = b''
+        if self.mmap is not None:
+            self.mmap.close()
+            self.mmap = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class RDPPool:
+    # Keeps one descriptor per RDP for the whole process instead of open/seek/read/close per fileset.
+    # RDP paths are looked up per (address_mode, directory) until they're found (then they're kept, a
+    # missing one is looked for again next time, it may have been put there since) and reads go through os.pread, so any
+    # number of threads can share a descriptor without racing on the seek position.
+    # (no pread on Windows, there a per-file lock around lseek + read does the same job)
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.paths = {}
+        self.fds = {}
+        self.fd_locks = {}
+
+    def resolve(self, address_mode, base_dir=None):
+        # RDP path for an address mode, or None if it doesn't exist (see find_rdp_path for where it looks)
+        key = (address_mode, base_dir)
+        rdp_path = self.paths.get(key)
+        if rdp_path is None:
+            rdp_path = find_rdp_path(address_mode, base_dir)
+            if rdp_path is not None:
+                with self.lock:
+                    self.paths[key] = rdp_path
+        return rdp_path
+
+    def _fd(self, path):
+        fd = self.fds.get(path)
+        if fd is None:
+            with self.lock:
+                fd = self.fds.get(path)
+                if fd is None:
+                    fd = os.open(path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+                    self.fd_locks[path] = threading.Lock()
+                    self.fds[path] = fd
+        return fd
+
+    def read(self, path, offset, size):
+        # Reads up to size bytes at offset, only comes back short at the end of the file
+        fd = self._fd(path)
+        if hasattr(os, 'pread'):
+            chunks = []
+            while size > 0:
+                chunk = os.pread(fd, size, offset)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                offset += len(chunk)
+                size -= len(chunk)
+            return chunks[0] if len(chunks) == 1 else b''.join(chunks)
+        with self.fd_locks[path]:
+            os.lseek(fd, offset, os.SEEK_SET)
+            chunks = []
+            while size > 0:
+                chunk = os.read(fd, size)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                size -= len(chunk)
+            return chunks[0] if len(chunks) == 1 else b''.join(chunks)
+
+    def close(self):
+        with self.lock:
+            for fd in self.fds.values():
+                os.close(fd)
+            self.fds.clear()
+            self.fd_locks.clear()
+            self.paths.clear()
+
+# Shared by everything in the process
+RDP_POOL = RDPPool()
+
+
+# Holes smaller than this between two RDP chunks get read through instead of seeked over
+# (entries sit on 0x800 sectors, so neighbours are usually less than a sector apart)
+COALESCE_GAP = 0x10000
+# but a single merged read never grows past this
+COALESCE_LIMIT = 0x800000
+
+def plan_reads(requests, max_gap=COALESCE_GAP, max_read=COALESCE_LIMIT, stream_threshold=None):
+    # requests = [(source, offset, size, unpack_size, item), ...]
+    # Groups them per source, sorts by offset and merges neighbours into bigger sequential reads.
+    # Gives back [[source, start, length, [(item, offset inside the read, size), ...], streamed], ...]
+    # Chunks that are (or unpack to) more than stream_threshold are never merged, they get a read of
+    # their own marked as streamed. (unpack_size None: only the stored size counts.)
+    reads = []
+    for source, offset, size, unpack_size, item in sorted(requests, key=lambda request: request[:3]):
+        if stream_threshold is not None and max(size, unpack_size or 0) > stream_threshold:
+            reads.append([source, offset, size, [(item, 0, size)], True])
+            continue
+        if reads:
+            last = reads[-1]
+            last_end = last[1] + last[2]
+            new_end = max(last_end, offset + size)
+            if last[0] == source and not last[4] and offset - last_end <= max_gap and new_end - last[1] <= max_read:
+                last[2] = new_end - last[1]
+                last[3].append((item, offset - last[1], size))
+                continue
+        reads.append([source, offset, size, [(item, 0, size)], False])
+    return reads
+
+def read_coalesced(requests, pool=None, max_gap=COALESCE_GAP, max_read=COALESCE_LIMIT, stream_threshold=None, on_error=None):
+    # Runs plan_reads: one sequential read per merged range, yields (item, chunk_data) in offset order.
+    # A chunk cut short by the end of the file comes back short, same as a plain read would.
+    # Chunks stored or unpacking over stream_threshold aren't read here, they come back as a ChunkRef
+    # to be streamed (a 2MB BLZ2 that inflates to 500MB would otherwise get a 500MB buffer).
+    # If a merged read fails its items are read one by one, so only the ones that really can't be read
+    # are lost: those go to on_error(item, error) (or the error is raised without on_error).
+    pool = pool or RDP_POOL
+    for source, start, length, parts, streamed in plan_reads(requests, max_gap, max_read, stream_threshold):
+        if streamed:
+            yield parts[0][0], ChunkRef(source, start, length)
+            continue
+        try:
+            buffer = pool.read(source, start, length)
+        except OSError:
+            if on_error is None and len(parts) == 1:
+                raise
+            buffer = None
+        for item, relative_offset, size in parts:
+            if buffer is not None:
+                yield item, buffer[relative_offset:relative_offset + size]
+                continue
+            try:
+                chunk_data = pool.read(source, start + relative_offset, size)
+            except OSError as e:
+                if on_error is None:
+                    raise
+                on_error(item, e)
+                continue
+            yield item, chunk_data
+
+
+# Entries with at least this many blocks get them inflated in parallel, below that the pool isn't worth it
+PARALLEL_BLOCKS = 4
+_block_pool = None
+_block_pool_lock = threading.Lock()
+
+def get_block_pool():
+    # One thread pool per process for inflating blocks, only made when something big shows up
+    global _block_pool
+    if _block_pool is None:
+        with _block_pool_lock:
+            if _block_pool is None:
+                _block_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+    return _block_pool
+
+def inflate_blocks(blocks, inflate):
+    # Every BLZ2/BLZ4 block is its own deflate stream (the reordering only happens after inflating),
+    # so big entries send their blocks to the pool. zlib lets go of the GIL, results keep the block order.
+    # Gives back an iterator, so each block can be copied where it belongs and dropped right away.
+    if len(blocks) < PARALLEL_BLOCKS:
+        return map(inflate, blocks)
+    return get_block_pool().map(inflate, blocks)
+
+# Deflate can't get more than about 1032 bytes out of a stored byte, an unpack_size past that is broken
+MAX_INFLATE_RATIO = 1032
+
+def assemble_blocks(decompressed_blocks, unpack_size=None, stored_size=None):
+    # Puts inflated blocks (in stored order) into one bytearray of unpack_size: the first stored block
+    # goes into the last slot, every other block into the next slot from the start. No list reordering,
+    # no join, and the bytearray goes to the writer as is.
+    # If unpack_size is unknown or doesn't add up, whatever's been placed so far gets fixed up in place.
+    # unpack_size comes from a TOC or a BLZ4 header, so it's only used if stored_size (the compressed
+    # size) could actually inflate to it, a broken one doesn't get to allocate gigabytes up front.
+    blocks = iter(decompressed_blocks)
+    first_block = next(blocks, None)
+    if first_block is None:
+        return bytearray()
+    if stored_size is not None and unpack_size is not None and unpack_size > stored_size * MAX_INFLATE_RATIO:
+        unpack_size = None
+    if unpack_size is None or len(first_block) > unpack_size:
+        output = bytearray().join(blocks)
+        output += first_block
+        return output
+
+    output = bytearray(unpack_size)
+    tail_pos = unpack_size - len(first_block)
+    output[tail_pos:] = first_block
+    pos = 0
+    with memoryview(output) as view:
+        for block in blocks:
+            if pos + len(block) > tail_pos:
+                break
+            view[pos:pos + len(block)] = block
+            pos += len(block)
+        else:
+            block = None
+    if block is not None: # ran past the slot of the first block, unpack_size was too small
+        del output[pos:]
+        output += block
+        for block in blocks:
+            output += block
+        output += first_block
+    elif pos != tail_pos: # came up short, unpack_size was too big
+        output[pos:pos + len(first_block)] = first_block
+        del output[pos + len(first_block):]
+    return output
+
+def _inflate_blz2_block(block):
+    # raw deflate, gives back (data, has unused data, reached the end)
+    decompressor = zlib.decompressobj(wbits=-15)
+    decompressed_data = decompressor.decompress(block)
+    return decompressed_data, bool(decompressor.unused_data), decompressor.eof
+
+def _inflate_blz4_block(block):
+    try:
+        return zlib.decompress(block)
+    except zlib.error as e:
+        raise ValueError(f"Failed to decompress block: {e}")
+
+def deflate_blocks(blocks, deflate):
+    # inflate_blocks the other way around, zlib lets go of the GIL while compressing too
+    return inflate_blocks(blocks, deflate)
+
+def deflate_stream(blocks, deflate, window=None):
+    # deflate_blocks for a lazy iterator of blocks: only `window` blocks are in flight at a time,
+    # so memory stays bounded however long the input is. Results still come back in order.
+    window = window or 2 * (os.cpu_count() or 1)
+    pool = get_block_pool()
+    pending = collections.deque()
+    for block in blocks:
+        pending.append(pool.submit(deflate, block))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def inflate_stream(blocks, inflate, window=None):
+    # inflate_blocks for entries that get streamed: deflate_stream the other way around, so only
+    # `window` blocks are inflating (and held) at a time and they still come back in order
+    if len(blocks) < PARALLEL_BLOCKS:
+        return map(inflate, blocks)
+    return deflate_stream(blocks, inflate, window)
+
+
+# Chunks bigger than this aren't read into memory at all, they get streamed block by block
+# from their source straight into the output file
+STREAM_THRESHOLD = COALESCE_LIMIT
+# piece size for copying uncompressed chunks that are streamed
+STREAM_COPY_SIZE = 0x100000
+# Nested archives up to this size (decompressed) are handed to the recursion straight from memory
+# instead of being read back from the file that was just written
+NESTED_BUFFER_LIMIT = 0x4000000
+# How much of them can be waiting in memory at once, across the whole tree
+NESTED_MEMORY_BUDGET = 0x20000000
+
+class ChunkRef:
+    # Where a chunk lives (source file, offset, size) without reading it. Cheap to send to a worker
+    # process, which then reads it through its own RDP_POOL.
+    # data is for chunks of an archive that's only in memory, offset is then relative to it.
+    def __init__(self, path, offset, size, data=None):
+        self.path = path
+        self.offset = offset
+        self.size = size
+        self.data = data
+
+    def __len__(self):
+        return self.size
+
+    def read(self, offset, size):
+        # offset is relative to the chunk, never reads past its end
+        size = max(0, min(size, self.size - offset))
+        if self.data is not None:
+            return self.data[self.offset + offset:self.offset + offset + size]
+        return RDP_POOL.read(self.path, self.offset + offset, size) if size else b''
+
+def scan_blz_blocks(read, chunk_size, compression):
+    # Walks a BLZ2/BLZ4 block table through read(offset, size), only the 2 byte size fields get read.
+    # Gives back ([(offset, size), ...] in stored order, unpack_size, md5), the last two only for BLZ4.
+    unpack_size = md5 = None
+    pos = 4
+    if compression == 'blz4':
+        header = read(0, 32)
+        if len(header) < 32 or chunk_size <= 32 + 2:
+            raise ValueError(f"Input data length {chunk_size} is too short for BLZ4 format")
+        unpack_size = struct.unpack_from('<I', header, 4)[0]
+        md5 = bytes(header[16:32])
+        pos = 32
+
+    blocks = []
+    while pos < chunk_size:
+        size_bytes = read(pos, 2)
+        if len(size_bytes) != 2:
+            raise ValueError(f"Failed to read compressed block size at block {len(blocks) + 1}")
+        block_size = struct.unpack('<H', size_bytes)[0]
+        pos += 2
+        if block_size == 0 and compression == 'blz4':
+            # zero size = the rest of the chunk is the final block
+            blocks.append((pos, chunk_size - pos))
+            break
+        if pos + block_size > chunk_size:
+            raise ValueError(f"Incomplete compressed block {len(blocks) + 1}: expected {block_size} bytes, got {chunk_size - pos}")
+        blocks.append((pos, block_size))
+        pos += block_size
+
+    if not blocks:
+        raise ValueError(f"No compressed blocks found in {compression.upper()} data")
+    return blocks, unpack_size, md5
+
+def _output_can_seek(out):
+    # Writing the last block ahead takes a regular file that isn't in append mode (appends land at the
+    # end whatever the seek said). Pipes, terminals and >> redirections get everything in order.
+    if not out.seekable():
+        return False
+    try:
+        fd = out.fileno()
+    except (OSError, ValueError, AttributeError): # in-memory buffers
+        return True
+    if not stat.S_ISREG(os.fstat(fd).st_mode):
+        return False
+    if fcntl is not None:
+        return not fcntl.fcntl(fd, fcntl.F_GETFL) & os.O_APPEND
+    return 'a' not in getattr(out, 'mode', '')
+
+def decompress_to_file(read, chunk_size, out, unpack_size=None):
+    # Streams a BLZ2/BLZ4 chunk into out a few blocks at a time (inflated on the block pool, written in
+    # order), so memory stays at a window of blocks no matter how big the asset is. The first stored
+    # block belongs at the very end of the output: on a seekable file it goes straight to
+    # unpack_size - len(block) past where out was when this got called, everything else is then written
+    # in order from there. (Pipes can't seek, there that one block is held until the end instead.)
+    # Leaves out positioned at the end of what it wrote, so several entries can go into one file.
+    # read(offset, size) reads from the compressed chunk. Returns the number of bytes written.
+    compression = get_compression(read(0, 4))
+    if compression is None:
+        raise ValueError("Chunk is not BLZ2/BLZ4 compressed")
+    blocks, header_unpack_size, md5 = scan_blz_blocks(read, chunk_size, compression)
+    if header_unpack_size is not None:
+        unpack_size = header_unpack_size
+    if unpack_size is not None and unpack_size > chunk_size * MAX_INFLATE_RATIO:
+        unpack_size = None  # broken, don't seek out that far for it
+    digest = hashlib.md5() if md5 is not None else None
+
+    def inflate(index):
+        offset, size = blocks[index]
+        block = read(offset, size)
+        if compression == 'blz4':
+            return _inflate_blz4_block(block)
+        decompressed_data, has_unused_data, is_eof = _inflate_blz2_block(block)
+        if has_unused_data:
+            print(f"Warning: Unused data after decompression in block {index + 1}")
+        if not is_eof:
+            print(f"Warning: Decompression may be incomplete in block {index + 1}")
+        return decompressed_data
+
+    first_block = inflate(0)
+    if len(blocks) == 1:
+        out.write(first_block)
+        written = len(first_block)
+    else:
+        seekable = _output_can_seek(out)
+        base = out.tell() if seekable else 0
+        first_size = len(first_block)
+        tail_pos = None
+        if seekable and unpack_size is not None and unpack_size >= first_size:
+            tail_pos = unpack_size - first_size
+            out.seek(base + tail_pos)
+            out.write(first_block)
+            out.seek(base)
+            first_block = None  # it's on disk now, don't hold on to it
+
+        written = 0
+        for decompressed_data in inflate_stream(range(1, len(blocks)), inflate):
+            out.write(decompressed_data)
+            if digest is not None:
+                digest.update(decompressed_data)
+            written += len(decompressed_data)
+
+        if tail_pos != written:
+            # unpack_size was off (or unusable), put the first block where the data really ends
+            if first_block is None:
+                first_block = inflate(0)
+            if seekable:
+                out.seek(base + written)
+            out.write(first_block)
+            if seekable:
+                out.truncate()
+        elif seekable:
+            out.seek(base + written + first_size)
+        written += first_size
+
+    if digest is not None:
+        # the first stored block is the last piece of the output, so it's hashed last
+        digest.update(first_block if first_block is not None else inflate(0))
+        if digest.digest() != md5:
+            print("Warning: BLZ4 MD5 checksum mismatch. Output may be corrupted.")
+    return written
+
+
+class StringTable:
+    # Resolves the null terminated strings behind offset_name pointers, but only when someone asks.
+    # Each pointer is decoded once, so the type and directory strings shared by lots of filesets
+    # come out of the cache, and every string is interned so repeated directory names share memory.
+    def __init__(self, file_data, encoding='latin-1', errors='strict'):
+        self.file_data = file_data
+        self.encoding = encoding
+        self.errors = errors
+        self.strings = {}
+
+    def get(self, pointer):
+        string = self.strings.get(pointer)
+        if string is None:
+            if pointer == 0 or pointer >= len(self.file_data):
+                return ''
+            end_pos = self.file_data.find(b'\x00', pointer)
+            if end_pos == -1:
+                end_pos = len(self.file_data)
+            string = sys.intern(bytes(self.file_data[pointer:end_pos]).decode(self.encoding, self.errors))
+            self.strings[pointer] = string
+        return string
+
+    def pointers(self, offset_name, chunk_name):
+        # offset_name holds chunk_name pointers (4 bytes each), read them in one go. The ones past
+        # the end of the file are left out, a broken entry just ends up without a name
+        if offset_name + 4 > len(self.file_data):
+            return ()
+        chunk_name =max(0, min(chunk_name, (len(self.file_data) - offset_name) // 4))
+        return struct.unpack_from(f'<{chunk_name}I', self.file_data, offset_name)
+
+    def name_info(self, offset_name, chunk_name):
+        # pointer 0 = name, pointer 1 = type, everything after = directories
+        name_info = {'name': '', 'type': '', 'directories': []}
+        if offset_name == 0 or chunk_name == 0:
+            return name_info
+        for i, pointer in enumerate(self.pointers(offset_name, chunk_name)):
+            if pointer == 0 or pointer >= len(self.file_data):
+                continue
+            string = self.get(pointer)
+            if i == 0:
+                name_info['name'] = string
+            elif i == 1:
+                name_info['type'] = string
+            else:
+                name_info['directories'].append(string)
+        return name_info
+
+
+class FilesetEntry(dict):
+    # A fileset dict that only looks up 'name', 'type' and 'directories' the first time one of them is used.
+    # Callers that only need offsets and sizes never touch the name table at all.
+    __slots__ = ('string_table',)
+
+    def __init__(self, string_table, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.string_table = string_table
+
+    def __missing__(self, key):
+        if key in ('name', 'type', 'directories') and self.string_table is not None:
+            self.update(self.string_table.name_info(self['offset_name'], self['chunk_name']))
+            self.string_table = None
+            return self[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+
+# Bumped whenever the manifest layout changes
+MANIFEST_VERSION = 1
+# Same for the --resume journal, and how many entries it takes before it gets flushed to disk
+JOURNAL_VERSION = 2
+JOURNAL_CHECKPOINT = 64
+
+class OutputNames:
+    # Hands out the output paths (name, or name_0001, name_0002... when it's taken) without going to the
+    # filesystem for every one: a directory gets listed once, the first time a name is asked for in it,
+    # after that it's set lookups, and the suffix for a name carries on from the last one handed out
+    # instead of probing from _0001 again. Also remembers which directories are already there, so
+    # makedirs runs once per directory instead of once per file.
+    # One per run, shared by every archive (and worker) in it.
+    # scan_disk=False never lists anything, for naming a tree that isn't being written (walk_archive_tree).
+    def __init__(self, scan_disk=True):
+        self.scan_disk = scan_disk
+        self.lock = threading.Lock()
+        self.taken = {}     # directory -> normcased names in it, on disk or handed out
+        self.counters = {}  # (directory, normcased name) -> last suffix handed out for it
+        self.dirs = set()
+
+    def ensure_dir(self, directory):
+        key = os.path.normcase(os.path.abspath(directory))
+        if key not in self.dirs:
+            os.makedirs(directory, exist_ok=True)
+            self.dirs.add(key)
+
+    def reserve(self, directory, filename, journal=None):
+        # A path in directory nothing else has or will get. Files a --resume journal says the last
+        # run wrote itself don't count as taken, they're meant to be reused.
+        key = os.path.normcase(os.path.abspath(directory))
+        base, ext = os.path.splitext(filename)
+        with self.lock:
+            taken = self.taken.get(key)
+            if taken is None:
+                try:
+                    existing = os.listdir(directory) if self.scan_disk else ()
+                except OSError:
+                    existing = ()
+                taken = self.taken[key] = {os.path.normcase(name) for name in existing
+                                           if journal is None or not journal.owns(os.path.join(directory, name))}
+            name = filename
+            if os.path.normcase(name) in taken:
+                counter_key = (key, os.path.normcase(filename))
+                counter = self.counters.get(counter_key, 0)
+                while os.path.normcase(name) in taken:
+                    counter += 1
+                    name = f"{base}_{counter:04d}{ext}" # handles duplicates
+                self.counters[counter_key] = counter
+            taken.add(os.path.normcase(name))
+        return os.path.join(directory, name)
+
+
+class ExtractOptions:
+    # Settings for a whole parse_res_file run, handed down to every nested archive.
+    # jobs > 1 decompresses and writes chunks on a worker pool (threads by default, zlib lets go
+    # of the GIL while inflating) while the main thread keeps reading ahead.
+    # manifest=True collects an entry per extracted file (MD5, size, mtime and where its stored bytes are)
+    # into system.manifest.json, so RES_Packer can tell which files were edited since.
+    # dedup ('hardlink' or 'reflink') writes every distinct file once: chunks with the same stored bytes
+    # aren't even decompressed again, and outputs that come out the same are linked to the first one.
+    # Filesets pointing at the same stored range (system.res, country tables and nested archives all do it)
+    # are always caught up front: the range is read and decompressed once, the rest are copies of it.
+    # resume=True keeps <name>.journal.jsonl of what got written, a rerun skips everything it says is done.
+    # write_containers=False leaves nested .res/.rtbl files out of the output, only what's in them gets written.
+    # Nested archives are extracted by a NestedScheduler, on jobs workers too, holding at most
+    # memory_budget bytes of them in memory. However many archives are going at once, they share
+    # jobs * 2 slots for chunks on the worker pool (chunk_slots), so chunk memory doesn't grow with jobs².
+    def __init__(self, jobs=1, use_processes=False, manifest=False, dedup=None, resume=False, write_containers=True,
+                 memory_budget=NESTED_MEMORY_BUDGET):
+        self.jobs = max(1, jobs)
+        self.use_processes = use_processes
+        self.executor = None
+        self.manifest = {} if manifest else None
+        self.dedup = dedup
+        self.resume = resume
+        self.write_containers = write_containers
+        self.memory_budget = memory_budget
+        self.journal = None     # the ExtractJournal while a --resume run is going
+        self.rdp_dir = None     # folder of the top archive, RDPs are looked for there before SCRIPT_DIR
+        self.names = OutputNames()
+        self.ranges = {}        # (source, offset, size) -> first output path, aliases get copied/linked from it
+        self.stored_blobs = {}  # MD5 of the stored chunk -> first output path it went to
+        self.output_blobs = {}  # MD5 of the output -> first output path with it
+        self.finished = {}      # output path -> what write_chunk said once it's done (None if it failed)
+        self.dedup_links = []   # (original, duplicate, size, how it was linked)
+        self.memory_held = 0    # bytes of nested archives waiting in memory, see hold_nested
+        self.memory_lock = threading.Lock()
+        self.chunk_slots = threading.Semaphore(self.jobs * 2)  # chunks submitted and not collected yet
+
+    def hold_nested(self, size):
+        # Counts a nested archive's data against memory_budget the moment it comes out of write_chunk.
+        # False if it doesn't fit, then it has to wait for its turn on disk.
+        with self.memory_lock:
+            if self.memory_held + size > self.memory_budget:
+                return False
+            self.memory_held += size
+            return True
+
+    def release_nested(self, size):
+        with self.memory_lock:
+            self.memory_held -= size
+
+    def get_executor(self):
+        if self.jobs > 1 and self.executor is None:
+            pool_class = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+            self.executor = pool_class(max_workers=self.jobs)
+        return self.executor
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+
+def is_nested_archive(file_type, output_path):
+    return file_type in ('res', 'rtbl') or os.path.splitext(output_path)[1].lower() in ('.res', '.rtbl')
+
+def write_chunk(job, chunk_data, base_output_dir, hash_output=False, write_containers=True):
+    # Decompresses (if needed) and writes one chunk to its reserved output path.
+    # Runs on the worker pool, so it only gives back what to print, the nested archive if it was one
+    # ((path, data), data being None if it has to be read back from path) and whether it worked:
+    # the MD5 of what got written with hash_output (manifest/dedup), True without, None if it failed
+    # or if it's a nested archive that write_containers=False kept in memory only.
+    index, output_path, display_path, file_type, size, unpack_size = job
+    if isinstance(chunk_data, ChunkRef):
+        return write_streamed_chunk(job, chunk_data, base_output_dir, hash_output)
+    if size > 0 and len(chunk_data) != size:
+        return [f"Skipping: {display_path} (Chunk size mismatch)"], None, None
+
+    try:
+        # Check for BLZ2/BLZ4 headers on chunks if it's compressed
+        final_data = chunk_data
+        if size >= 4:
+            header = chunk_data[:4]
+            if header == BLZ2_HEADER:
+                try:
+                    final_data = FileSet._decompress_blz2(None, chunk_data, unpack_size)
+                except Exception as e:
+                    return [f"Skipping: {display_path} (BLZ2 decompression error: {str(e)})"], None, None
+            elif struct.unpack('<I', header)[0] == BLZ4_HEADER:
+                try:
+                    final_data = FileSet._decompress_blz4(None, chunk_data)
+                except Exception as e:
+                    return [f"Skipping: {display_path} (BLZ4 decompression error: {str(e)})"], None, None
+
+        output_display_path = os.path.relpath(output_path, start=os.path.dirname(base_output_dir))
+        nested = None
+        if is_nested_archive(file_type, output_path):
+            # Nested archives go to the recursion straight from memory, unless they're too big to keep around
+            nested = (output_path, final_data if len(final_data) <= NESTED_BUFFER_LIMIT else None)
+            if nested[1] is not None and not write_containers:
+                return [f"Opening: .\\{output_display_path} (not written)"], nested, None
+
+        # Write data
+        with open(output_path, 'wb') as f:
+            f.write(final_data)
+        messages = [f"Extracting: .\\{output_display_path}"]
+        digest = hashlib.md5(final_data).hexdigest() if hash_output else True
+        return messages, nested, digest
+
+    except Exception as e:
+        return [f"Skipping: {display_path} (Extraction error: {str(e)})"], None, None
+
+
+def write_streamed_chunk(job, chunk_ref, base_output_dir, hash_output=False):
+    # write_chunk for chunks too big to hold in memory: copied or decompressed piece by piece
+    # (nested archives included, those always get written and are read back from the file)
+    index, output_path, display_path, file_type, size, unpack_size = job
+    compression = get_compression(chunk_ref.read(0, 4))
+    try:
+        with open(output_path, 'wb') as f:
+            if compression is None:
+                pos = 0
+                while pos < size:
+                    piece = chunk_ref.read(pos, STREAM_COPY_SIZE)
+                    if not piece:
+                        break
+                    f.write(piece)
+                    pos += len(piece)
+                if pos != size:
+                    raise EOFError
+            else:
+                decompress_to_file(chunk_ref.read, size, f, unpack_size)
+    except Exception as e:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        if isinstance(e, EOFError):
+            return [f"Skipping: {display_path} (Chunk size mismatch)"], None, None
+        if compression is not None:
+            return [f"Skipping: {display_path} ({compression.upper()} decompression error: {str(e)})"], None, None
+        return [f"Skipping: {display_path} (Extraction error: {str(e)})"], None, None
+
+    output_display_path = os.path.relpath(output_path, start=os.path.dirname(base_output_dir))
+    messages = [f"Extracting: .\\{output_display_path}"]
+    digest = hash_file(output_path) if hash_output else True # the first block went in last, so read it back
+    if is_nested_archive(file_type, output_path):
+        return messages, (output_path, None), digest
+    return messages, None, digest
+
+
+def link_duplicate(source_path, output_path, mode):
+    # Makes output_path the same file as source_path without writing the data again.
+    # reflink clones it copy-on-write (Linux, on filesystems that can: btrfs, xfs...) so editing one
+    # copy later doesn't touch the others, hardlink shares the file itself.
+    # Falls back to a plain copy when the filesystem can't do either. Returns what it did.
+    if os.path.lexists(output_path):
+        os.remove(output_path)
+    if mode == 'reflink':
+        try:
+            import fcntl
+            with open(source_path, 'rb') as src, open(output_path, 'wb') as dst:
+                fcntl.ioctl(dst.fileno(), 0x40049409, src.fileno()) # FICLONE
+            return 'reflink'
+        except (ImportError, OSError):
+            pass
+    elif mode == 'hardlink':
+        try:
+            os.link(source_path, output_path)
+            return 'hardlink'
+        except OSError:
+            pass
+    shutil.copyfile(source_path, output_path)
+    return 'copy'
+
+def write_dedup_report(options, base_output_dir, report_path):
+    # What got linked to what, and how much writing that saved
+    groups = {}
+    methods = collections.Counter()
+    for original, duplicate, size, how in options.dedup_links:
+        groups.setdefault(os.path.relpath(original, base_output_dir).replace(os.sep, '/'), []).append(
+            os.path.relpath(duplicate, base_output_dir).replace(os.sep, '/'))
+        methods[how] += 1
+    bytes_saved = sum(size for _, _, size, how in options.dedup_links if how != 'copy')
+    report = {
+        'mode': options.dedup,
+        'unique_files': len(options.output_blobs),
+        'duplicates': len(options.dedup_links),
+        'bytes_saved': bytes_saved,
+        'methods': dict(methods),
+        'groups': groups,
+    }
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=1, sort_keys=True)
+    print(f"Dedup: {len(options.dedup_links)} duplicate(s) linked, {bytes_saved} bytes not written ({report_path})")
+
+def hash_file(path):
+    # MD5 (hex) of a file, read a piece at a time
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        while True:
+            piece = f.read(STREAM_COPY_SIZE)
+            if not piece:
+                break
+            md5.update(piece)
+    return md5.hexdigest()
+
+def read_manifest(manifest_path):
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('version') != MANIFEST_VERSION:
+        raise ValueError(f"{manifest_path} is from an incompatible version")
+    return manifest
+
+def write_manifest(manifest, manifest_path):
+    # Written to a temp file first, a half written manifest would make every file look changed
+    temp_path = manifest_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(temp_path, manifest_path)
+
+def get_manifest_path(res_path):
+    # system.res -> system.manifest.json, next to the system folder it describes
+    return os.path.splitext(res_path)[0] + '.manifest.json'
+
+def get_journal_path(res_path):
+    # system.res -> system.journal.jsonl
+    return os.path.splitext(res_path)[0] + '.journal.jsonl'
+
+
+class ExtractJournal:
+    # What a --resume run has finished so far: one JSON line per output (where it came from: source, offset,
+    # stored and unpacked size, and what got written: size, mtime, MD5 if it was hashed).
+    # Lines get appended as entries finish and flushed every JOURNAL_CHECKPOINT of them, so a crash or Ctrl-C
+    # loses at most the last few. A rerun skips any entry whose range is the same as recorded and whose output
+    # still has the recorded size and mtime (or MD5) without reading it, everything else is extracted again.
+    # Before any output is opened it gets an intent line (flushed right away, see intend): files a run that
+    # died left behind without a record are still the journal's, so the rerun gives them the same names and
+    # checks (and rewrites) them instead of treating them as someone else's and moving on to _0001.
+    # Ranges are all it goes by, a chunk rewritten in place with the exact same size needs a run without it.
+    def __init__(self, path, base_output_dir):
+        self.path = path
+        self.base_output_dir = base_output_dir
+        self.entries = {}   # output path (relative to base_output_dir, '/' separated) -> its record
+        self.done = set()   # entries this run wrote or found unchanged, the rest get dropped on compact()
+        self.intents = set()  # outputs opened without a record yet, by this run or one that didn't finish
+        self.unflushed = 0
+        self.lock = threading.Lock()  # nested archives can be on several workers at once
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                header = json.loads(f.readline() or '{}')
+                if header.get('version') == JOURNAL_VERSION:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            break # a line cut short by a crash, nothing after it got written either
+                        if record.get('intent'):
+                            self.intents.add(record['path'])
+                        else:
+                            self.entries[record.pop('path')] = record
+        except FileNotFoundError:
+            pass
+        self.file = None
+        self._rewrite(self.entries)
+
+    def _key(self, output_path):
+        return os.path.relpath(output_path, self.base_output_dir).replace(os.sep, '/')
+
+    def _rewrite(self, entries):
+        # Starts the journal over with just these entries (written to a temp file first, like the manifest)
+        if self.file is not None:
+            self.file.close()
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'version': JOURNAL_VERSION}) + '\n')
+            for key, record in entries.items():
+                f.write(json.dumps(dict(record, path=key), sort_keys=True) + '\n')
+            for key in sorted(self.intents - entries.keys()):
+                f.write(json.dumps({'intent': True, 'path': key}, sort_keys=True) + '\n')
+        os.replace(temp_path, self.path)
+        self.file = open(self.path, 'a', encoding='utf-8')
+
+    def owns(self, output_path):
+        # Outputs on disk the journal accounts for, they don't count as name clashes
+        key = self._key(output_path)
+        return key in self.entries or key in self.intents
+
+    def intend(self, output_paths):
+        # Called with outputs about to be opened, before they are. One flush for the lot, so it's
+        # on disk (as far as a killed process goes) before any of them can be.
+        lines = []
+        with self.lock:
+            for output_path in output_paths:
+                key = self._key(output_path)
+                if key not in self.entries and key not in self.intents:
+                    self.intents.add(key)
+                    lines.append(json.dumps({'intent': True, 'path': key}, sort_keys=True) + '\n')
+            if lines:
+                self.file.write(''.join(lines))
+                self.file.flush()
+
+    def check(self, output_path, source, offset, stored_size, unpack_size):
+        # Returns the record if output_path is still what that range extracted to last time.
+        # Otherwise a stale output is removed right away: it's about to be rewritten, and if it's
+        # a hardlink (--dedup) writing over it would change the files it's linked to as well.
+        key = self._key(output_path)
+        record = self.entries.get(key)
+        try:
+            stat = os.stat(output_path)
+        except OSError:
+            return None
+        if record is not None and (record['source'], record['offset'], record['stored_size'],
+                                   record['unpack_size']) == (source, offset, stored_size, unpack_size) \
+                and stat.st_size == record['size']:
+            if stat.st_mtime_ns == record['mtime_ns']:
+                self.done.add(key)
+                return record
+            if record.get('md5') is not None and hash_file(output_path) == record['md5']:
+                self.record(output_path, source, offset, stored_size, unpack_size, record['md5']) # copied around, same data
+                return self.entries[key]
+        os.remove(output_path)
+        return None
+
+    def record(self, output_path, source, offset, stored_size, unpack_size, digest=None):
+        key = self._key(output_path)
+        stat = os.stat(output_path)
+        record = {
+            'source': source, 'offset': offset, 'stored_size': stored_size, 'unpack_size': unpack_size,
+            'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'md5': digest,
+        }
+        line = json.dumps(dict(record, path=key), sort_keys=True) + '\n'
+        with self.lock:
+            self.entries[key] = record
+            self.done.add(key)
+            self.file.write(line)
+            self.unflushed += 1
+            if self.unflushed >= JOURNAL_CHECKPOINT:
+                self.file.flush()
+                self.unflushed = 0
+
+    def compact(self):
+        # After a run that went all the way through: one line per output that's still there
+        self.intents.clear()
+        self._rewrite({key: record for key, record in self.entries.items() if key in self.done})
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
 class Header:
     # Here, this processes the .res file's header
     def __init__(self, file_data):
@@ -22,7 +979,7 @@ class Header:
         # padding (3), 
         # configs (4), 
         # padding (12)
-        header_struct = struct.unpack('<I I B I 3x I 12x', file_data[:32])
+        header_struct = struct.unpack_from('<I I B I 3x I 12x', file_data)
         self.magic = header_struct[0]
         self.group_offset = header_struct[1]
         self.group_count = header_struct[2]
@@ -40,7 +997,7 @@ class DataSet:
         # Each dataset is 8 bytes per group: offset (4) + count (4)
         for i in range(group_count):
             offset = group_offset + (i * 8) # i = group count. thus 8 * 8 = 64
-            dataset_struct = struct.unpack('<I I', file_data[offset:offset+8])
+            dataset_struct = struct.unpack_from('<I I', file_data, offset)
             dataset_offset = dataset_struct[0]
             dataset_count = dataset_struct[1]
             self.datasets.append({'offset': dataset_offset, 'count': dataset_count})
@@ -48,8 +1005,9 @@ class DataSet:
 class FileSet:
     # The Stuff
     # Fileset always starts at 0x60 and ends by measuring it based on all datasets counts * 32
-    def __init__(self, file_data, datasets, input_file, output_dir, base_output_dir):
+    def __init__(self, file_data, datasets, input_file, output_dir, base_output_dir, options=None):
         self.filesets = []
+        self.options = options if options is not None else ExtractOptions()
         self.input_file = input_file
         self.output_dir = output_dir
         self.base_output_dir = base_output_dir  # Main .res file's output directory
@@ -59,96 +1017,34 @@ class FileSet:
             0x60: 'patch.rdp'
         }
         self.nested_res_files = []  # Store paths of extracted .res and .rtbl files
+        self.nested_data = {}       # nested path -> its decompressed data, when it's still in memory
+        self.file_data = file_data  # 0xC0/0xD0 chunks get sliced straight out of this
         # Start reading filesets at 0x60
         fileset_start = 0x60
         total_fileset_count = sum(dataset['count'] for dataset in datasets) # gets all dataset counts
-        fileset_end = fileset_start + (total_fileset_count * 32) # 0x60 + total dataset counts multiply by 32 = fileset_end range
-
-        # Read each fileset (32 bytes)
-        for i in range(total_fileset_count):
-            offset = fileset_start + (i * 32) # total dataset count multiply by 32
-            fileset_struct = struct.unpack('<I I I I 12x I', file_data[offset:offset+32]) #reads each fileset 32 bytes per entry
-            raw_offset = fileset_struct[0] # offset that isn't touched on multiplication or remove it's address_mode
-            size = fileset_struct[1] # refers to the fileset's size range used on that specific given pointer location. 
-            offset_name = fileset_struct[2] # location of names but still has to go through name pointers
-            chunk_name = fileset_struct[3] # defines how many pointers on that offset_name
-            unpack_size = fileset_struct[4] # refers to the compressed file's true size
-
-            # Handle offset based on address mode
-            address_mode = (raw_offset & 0xFF000000) >> 24 # removes the address_mode
-            real_offset = None
-            skip_reason = None
-
-            if address_mode == 0x00:
-                skip_reason = "Unknown address mode (0x00)"
-                
-            elif address_mode == 0x30:
-                # skipped, already existing file within those `data_` prefix folders (FOR PSVITA ONLY).
-                skip_reason = "DataSet file (0x30)"
-                
-            elif address_mode in (0xC0, 0xD0): # i call this SET_C (0xC0) and SET_D (0xD0)
-                # this address_mode is based on the file's current location.
-                real_offset = raw_offset & 0x00FFFFFF 
-                
-            elif address_mode in (0x40, 0x50, 0x60):
-                # this address_mode is based on the file's current location within a specific RDP file.
-                temp_offset = raw_offset & 0x00FFFFFF 
-                real_offset = temp_offset * 0x800 # could have used Left Shift 11, but this will do
-
-            # Check for dummy fileset
-            if raw_offset == 0 and size == 0 and offset_name == 0 and chunk_name == 0 and unpack_size != 0:
-                skip_reason = "Dummy fileset"
-
-            # Read name and directory
-            name_info = self._read_name_info(file_data, offset_name, chunk_name)
-            fileset_data = {
+
+        # Decode the whole table at once (0x60 + total dataset counts * 32 = fileset_end range)
+        table = decode_fileset_table(file_data, fileset_start, total_fileset_count)
+        columns = zip(
+            table['raw_offset'], table['real_offset'], table['size'], table['offset_name'],
+            table['chunk_name'], table['unpack_size'], table['address_mode'], table['skip_reason']
+        )
+        # Names, types and directories are only read once an entry actually asks for them
+        string_table = StringTable(file_data)
+        for index, (raw_offset, real_offset, size, offset_name, chunk_name, unpack_size, address_mode, skip_reason) in enumerate(columns):
+            fileset_data = FilesetEntry(string_table, {
+                'toc_offset': fileset_start + index * 32, # where this fileset sits, the packer rewrites it there
                 'raw_offset': raw_offset,
                 'real_offset': real_offset, # results after trimmed and multiplied
                 'size': size,
                 'offset_name': offset_name,
                 'chunk_name': chunk_name,
                 'unpack_size': unpack_size,
-                'address_mode': address_mode,
-                'name': name_info['name'],
-                'type': name_info['type'],
-                'directories': name_info['directories']
-            }
+                'address_mode': address_mode
+            })
 
             self.filesets.append((fileset_data, skip_reason))
 
-    def _read_name_info(self, file_data, offset_name, chunk_name):
-        # Read name, type, and directories from offset_name."""
-        name_info = {'name': '', 'type': '', 'directories': []}
-        if offset_name == 0 or chunk_name == 0:
-            return name_info
-
-        pointer_count = chunk_name
-        pointers = []
-        for i in range(pointer_count):
-            pointer_offset = offset_name + (i * 4) # chunk_name value multiply by 4
-            pointer = struct.unpack('<I', file_data[pointer_offset:pointer_offset+4])[0]
-            pointers.append(pointer)
-
-        for i, pointer in enumerate(pointers): # here, it finds the strings based on the separated pointers found within offset_name
-            if pointer == 0:
-                continue
-            string = ''
-            pos = pointer
-            while pos < len(file_data): 
-                char = file_data[pos]
-                if char == 0:
-                    break
-                string += chr(char)
-                pos += 1
-            if i == 0:
-                name_info['name'] = string
-            elif i == 1:
-                name_info['type'] = string
-            else:
-                name_info['directories'].append(string)
-
-        return name_info
-
     def _read_rtbl_name_info(self, file_data, fileset_offset, chunk_name):
         """Read name and type for .rtbl files, skipping chunk_name pointers."""
         name_info = {'name': '', 'type': '', 'directories': []}
@@ -183,110 +1079,84 @@ class FileSet:
         base, ext = os.path.splitext(filename)
         if is_decompressed:
             base = f"{base}"
-        filepath = os.path.join(base_path, f"{base}{ext}")
-        if not os.path.exists(filepath):
-            return filepath
-
-        counter = 1
-        while True:
-            new_filename = f"{base}_{counter:04d}{ext}" # handles duplicates
-            new_filepath = os.path.join(base_path, new_filename)
-            if not os.path.exists(new_filepath):
-                return new_filepath
-            counter += 1
+        output_path = self.options.names.reserve(base_path, f"{base}{ext}", self.options.journal)
+        self.reservations.append((base_path, f"{base}{ext}", output_path))
+        return output_path
 
-    def _decompress_blz2(self, chunk_data):
+    def _decompress_blz2(self, chunk_data, unpack_size=None):
         #BLZ2 Decompression Procedures
-        decompressed_blocks = []
-        block_count = 0
-
-        with io.BytesIO(chunk_data) as f:
-            # Check header
-            header = f.read(4)
-            if header != BLZ2_HEADER:
-                raise ValueError(f"Invalid BLZ2 header: expected {BLZ2_HEADER}, got {header}")
-
-            # Process blocks
-            while True:
-                size_bytes = f.read(2)
-                if not size_bytes:
-                    break
-                if len(size_bytes) != 2:
-                    raise ValueError(f"Failed to read compressed block size at block {block_count + 1}")
-                compressed_size = struct.unpack('<H', size_bytes)[0]
-
-                compressed_data = f.read(compressed_size)
-                if len(compressed_data) != compressed_size:
-                    raise ValueError(f"Incomplete compressed block {block_count + 1}: expected {compressed_size} bytes, got {len(compressed_data)}")
-
-                decompressor = zlib.decompressobj(wbits=-15)
-                decompressed_data = decompressor.decompress(compressed_data)
-                decompressed_blocks.append(decompressed_data)
-
-                if decompressor.unused_data:
-                    print(f"Warning: Unused data after decompression in block {block_count + 1}")
-                if not decompressor.eof:
-                    print(f"Warning: Decompression may be incomplete in block {block_count + 1}")
-
-                block_count += 1
-
-            if block_count == 0:
-                raise ValueError("No compressed blocks found in BLZ2 data")
-
-        # Reorder blocks: move first block to the end if multiple
-        if block_count > 1:
-            decompressed_blocks = decompressed_blocks[1:] + decompressed_blocks[:1]
-
-        return b''.join(decompressed_blocks)
+        # Check header
+        header = bytes(chunk_data[:4])
+        if header != BLZ2_HEADER:
+            raise ValueError(f"Invalid BLZ2 header: expected {BLZ2_HEADER}, got {header}")
+
+        # Collect the blocks first (memoryview slices, nothing gets copied), then inflate them all at once
+        view = memoryview(chunk_data)
+        blocks = []
+        pos = 4
+        while pos < len(view):
+            if pos + 2 > len(view):
+                raise ValueError(f"Failed to read compressed block size at block {len(blocks) + 1}")
+            compressed_size = struct.unpack_from('<H', view, pos)[0]
+            pos += 2
+
+            compressed_data = view[pos:pos + compressed_size]
+            if len(compressed_data) != compressed_size:
+                raise ValueError(f"Incomplete compressed block {len(blocks) + 1}: expected {compressed_size} bytes, got {len(compressed_data)}")
+            blocks.append(compressed_data)
+            pos += compressed_size
+
+        if not blocks:
+            raise ValueError("No compressed blocks found in BLZ2 data")
+
+        def decompressed_blocks():
+            for block_number, (decompressed_data, has_unused_data, is_eof) in enumerate(inflate_blocks(blocks, _inflate_blz2_block), 1):
+                if has_unused_data:
+                    print(f"Warning: Unused data after decompression in block {block_number}")
+                if not is_eof:
+                    print(f"Warning: Decompression may be incomplete in block {block_number}")
+                yield decompressed_data
+
+        # The first block goes to the end, assemble_blocks puts it straight into its slot
+        return assemble_blocks(decompressed_blocks(), unpack_size, len(chunk_data))
 
     def _decompress_blz4(self, chunk_data):
         # BLZ4 Decompression Procedures
         if len(chunk_data) <= 32 + 2:
             raise ValueError(f"Input data length {len(chunk_data)} is too short for BLZ4 format")
 
-        block_data = []
-        with io.BytesIO(chunk_data) as f:
-            # Read magic header
-            magic = struct.unpack('<I', f.read(4))[0]
-            if magic != BLZ4_HEADER:
-                raise ValueError(f"Invalid BLZ4 magic number: {hex(magic)} != {hex(BLZ4_HEADER)}")
-
-            # Read metadata
-            unpack_size = struct.unpack('<I', f.read(4))[0]
-            padding = struct.unpack('<Q', f.read(8))[0]
-            md5 = f.read(16)
-
-            # Read data blocks
-            while f.tell() < len(chunk_data):
-                chunk_size_bytes = f.read(2)
-                if len(chunk_size_bytes) < 2:
-                    raise ValueError("Incomplete chunk size data")
-                chunk_size = struct.unpack('<H', chunk_size_bytes)[0]
-                if chunk_size == 0:
-                    block_data.append(f.read(len(chunk_data) - f.tell()))
-                    break
-                else:
-                    block = f.read(chunk_size)
-                    if len(block) < chunk_size:
-                        raise ValueError(f"Expected {chunk_size} bytes for block, got {len(block)}")
-                    block_data.append(block)
+        # Read magic header
+        magic = struct.unpack_from('<I', chunk_data, 0)[0]
+        if magic != BLZ4_HEADER:
+            raise ValueError(f"Invalid BLZ4 magic number: {hex(magic)} != {hex(BLZ4_HEADER)}")
 
-            if not block_data:
-                raise ValueError("No data blocks found in BLZ4 data")
+        # Read metadata: unpack_size (4), padding (8), md5 (16)
+        unpack_size, padding = struct.unpack_from('<I Q', chunk_data, 4)
+        md5 = bytes(chunk_data[16:32])
 
-        # Reorder blocks: last block first
-        real_list = block_data[1:] + [block_data[0]]
+        # Read data blocks (memoryview slices again)
+        view = memoryview(chunk_data)
+        block_data = []
+        pos = 32
+        while pos < len(view):
+            if pos + 2 > len(view):
+                raise ValueError("Incomplete chunk size data")
+            chunk_size = struct.unpack_from('<H', view, pos)[0]
+            pos += 2
+            if chunk_size == 0:
+                block_data.append(view[pos:])
+                break
+            block = view[pos:pos + chunk_size]
+            if len(block) < chunk_size:
+                raise ValueError(f"Expected {chunk_size} bytes for block, got {len(block)}")
+            block_data.append(block)
+            pos += chunk_size
 
-        # Decompress blocks
-        decompressed_blocks = []
-        for block in real_list:
-            try:
-                decompressed = zlib.decompress(block)
-                decompressed_blocks.append(decompressed)
-            except zlib.error as e:
-                raise ValueError(f"Failed to decompress block: {e}")
+        if not block_data:
+            raise ValueError("No data blocks found in BLZ4 data")
 
-        result = b''.join(decompressed_blocks)
+        # Decompress blocks into one unpack_size buffer, the first block lands at the end
+        result = assemble_blocks(inflate_blocks(block_data, _inflate_blz4_block), unpack_size, len(chunk_data))
 
         # Verify MD5
         computed_md5 = hashlib.md5(result).digest()
@@ -295,11 +1165,177 @@ class FileSet:
 
         return result
 
+    def _keep_in_memory(self, job):
+        # Nested archives that fit NESTED_BUFFER_LIMIT are meant to be decompressed into memory
+        # (they're handed to the recursion from there), only their stored size decides on streaming
+        return is_nested_archive(job[3], job[1]) and (job[5] or 0) <= NESTED_BUFFER_LIMIT
+
+    def _iter_chunks(self, local_jobs, rdp_requests):
+        # Local chunks (0xC0/0xD0) come straight out of the archive
+        for job, real_offset in local_jobs:
+            if max(job[4], job[5] or 0) > STREAM_THRESHOLD and not self._keep_in_memory(job):
+                # too big to inflate in one piece, streamed like the big RDP chunks
+                if self.file_data is not None:
+                    yield job, ChunkRef(None, 0, job[4], bytes(self.file_data[real_offset:real_offset + job[4]]))
+                else:
+                    yield job, ChunkRef(self.input_file, real_offset, job[4])
+                continue
+            try:
+                if self.file_data is not None:
+                    chunk_data = bytes(self.file_data[real_offset:real_offset + job[4]])
+                else:
+                    chunk_data = RDP_POOL.read(self.input_file, real_offset, job[4])
+            except Exception as e:
+                print(f"Skipping: {job[2]} (Extraction error: {str(e)})")
+                continue
+            yield job, chunk_data
+
+        # RDP chunks in offset order, a chunk that can't be read is skipped on its own
+        def skip_chunk(job, e):
+            print(f"Skipping: {job[2]} (Extraction error: {str(e)})")
+
+        yield from read_coalesced(rdp_requests, stream_threshold=STREAM_THRESHOLD, on_error=skip_chunk)
+
+    def _finish_chunk(self, job, result, nested_order):
+        messages, nested, written = result
+        for message in messages:
+            print(message)
+        options = self.options
+        if nested is not None:
+            nested_path, nested_data = nested
+            if nested_data is not None and not options.hold_nested(len(nested_data)):
+                # Over the memory budget: it waits its turn on disk instead (already there with containers)
+                if not options.write_containers:
+                    try:
+                        with open(nested_path, 'wb') as f:
+                            f.write(nested_data)
+                    except OSError as e:
+                        print(f"Skipping: {job[2]} (Extraction error: {str(e)})")
+                        return
+                nested_data = None
+            self.nested_res_files.append(nested_path)
+            nested_order[nested_path] = job[0]
+            if nested_data is not None:
+                self.nested_data[nested_path] = nested_data
+        output_path = job[1]
+        digest = written if isinstance(written, str) else None
+        if nested is not None and not options.write_containers:
+            return # only ever in memory (or written just to be read back and removed), nothing to record
+
+        options.finished[output_path] = written
+        if digest is not None and options.dedup is not None:
+            # Different stored bytes can still decompress to the same thing
+            original = options.output_blobs.setdefault(digest, output_path)
+            if original != output_path:
+                size = os.path.getsize(output_path)
+                options.dedup_links.append((original, output_path, size, link_duplicate(original, output_path, options.dedup)))
+        if written is not None:
+            self._record_entry(job[0], output_path, written)
+        for waiting_job in self.waiting.pop(output_path, ()):
+            self._link_duplicate(waiting_job, output_path, nested_order)
+
+    def _dedup_chunk(self, job, chunk_data, nested_order):
+        # Same stored bytes as a chunk that's already been handed out: it won't be decompressed or written
+        # again, it just gets linked to that one's output (right away, or once that's been written).
+        # Returns False if it's new and has to be written normally.
+        if isinstance(chunk_data, ChunkRef):
+            return False
+        options = self.options
+        original = options.stored_blobs.setdefault(hashlib.md5(chunk_data).digest(), job[1])
+        if original == job[1]:
+            return False
+        if original in options.finished:
+            self._link_duplicate(job, original, nested_order)
+        elif original in self.reserved_paths:
+            self.waiting.setdefault(original, []).append(job)
+        else:
+            return False # another archive (on another worker) is still writing it, not worth waiting for
+        return True
+
+    def _link_duplicate(self, job, original, nested_order):
+        # Fans an already written output out to another path: linked with --dedup, a plain copy otherwise
+        index, output_path, display_path, file_type = job[:4]
+        options = self.options
+        original_display_path = os.path.relpath(original, start=os.path.dirname(self.base_output_dir))
+        written = options.finished.get(original)
+        if written is None:
+            print(f"Skipping: {display_path} (same data as .\\{original_display_path}, which failed)")
+            return
+        try:
+            how = link_duplicate(original, output_path, options.dedup or 'copy')
+        except Exception as e:
+            print(f"Skipping: {display_path} (Extraction error: {str(e)})")
+            return
+        options.finished[output_path] = written
+        output_display_path = os.path.relpath(output_path, start=os.path.dirname(self.base_output_dir))
+        if options.dedup is not None:
+            options.dedup_links.append((original, output_path, os.path.getsize(output_path), how))
+            print(f"Extracting: .\\{output_display_path} ({how} of .\\{original_display_path})")
+        else:
+            print(f"Extracting: .\\{output_display_path}")
+        if is_nested_archive(file_type, output_path):
+            self.nested_res_files.append(output_path)
+            nested_order[output_path] = index
+        self._record_entry(index, output_path, written)
+
+    def _get_entry_range(self, index):
+        # (source, offset, stored size, unpack size) of a fileset, source being the RDP name or the archive
+        # relative to the output folder's parent. What the manifest and the --resume journal go by.
+        fileset = self.filesets[index][0]
+        source = RDP_FILES.get(fileset['address_mode']) or os.path.relpath(self.input_file, os.path.dirname(self.base_output_dir))
+        return source.replace(os.sep, '/'), fileset['real_offset'], fileset['size'], fileset['unpack_size']
+
+    def _add_manifest_entry(self, index, output_path, digest):
+        # Where the file came from and what it looked like
+        source, offset, stored_size, unpack_size = self._get_entry_range(index)
+        stat = os.stat(output_path)
+        self.options.manifest[os.path.relpath(output_path, self.base_output_dir).replace(os.sep, '/')] = {
+            'md5': digest, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+            'source': source, 'offset': offset, 'stored_size': stored_size, 'unpack_size': unpack_size,
+        }
+
+    def _record_entry(self, index, output_path, written):
+        # Adds a finished output to the manifest and the --resume journal (whichever are on)
+        digest = written if isinstance(written, str) else None
+        if digest is not None and self.options.manifest is not None:
+            self._add_manifest_entry(index, output_path, digest)
+        if self.options.journal is not None:
+            self.options.journal.record(output_path, *self._get_entry_range(index), digest)
+
+    def _keep_unchanged(self, job, record, nested_order):
+        # --resume: the output is already what this entry extracts to, so it's neither read nor written
+        index, output_path, display_path, file_type = job[:4]
+        options = self.options
+        digest = record['md5']
+        if digest is None and options.manifest is not None:
+            digest = hash_file(output_path)
+            options.journal.record(output_path, *self._get_entry_range(index), digest)
+        if digest is not None and options.manifest is not None:
+            self._add_manifest_entry(index, output_path, digest)
+        options.finished[output_path] = digest or True
+        output_display_path = os.path.relpath(output_path, start=os.path.dirname(self.base_output_dir))
+        print(f"Unchanged: .\\{output_display_path}")
+        if is_nested_archive(file_type, output_path):
+            self.nested_res_files.append(output_path)
+            nested_order[output_path] = index
+
     def extract_files(self):
         # Extraction Procedures
-        os.makedirs(self.output_dir, exist_ok=True)
-
-        for fileset, skip_reason in self.filesets:
+        # First pass walks the filesets in TOC order: skips, empty files and output names happen here.
+        # Second pass reads the chunks sorted by RDP and offset (merged into big sequential reads),
+        # so the RDPs get streamed through instead of being jumped around in.
+        self.options.names.ensure_dir(self.output_dir)
+        self.reservations = []  # (folder, name asked for, path handed out) in TOC order, for NestedScheduler
+        self.reserved_paths = set()
+        self.waiting = {}  # output path still being written -> jobs waiting to be linked to it
+        nested_order = {}  # output path -> TOC index, keeps nested files in TOC order
+        local_jobs = []
+        rdp_requests = []
+        aliases = []
+        options = self.options
+        manifest = options.manifest
+
+        for index, (fileset, skip_reason) in enumerate(self.filesets):
             address_mode = fileset['address_mode'] # checks the source
             real_offset = fileset['real_offset'] # uses the real offset. the result of the original offset being trimmed, and processed
             size = fileset['size'] # get's the size value, and uses it as the main part of collecting data
@@ -313,7 +1349,6 @@ class FileSet:
             # this mixes name+type (name and format) and directories.. if there's any
             relative_path = os.path.join(*directories) if directories else ''
             filename = f"{name}.{file_type}" if file_type else name
-            is_decompressed = False
 
             # Construct display path relative
             display_path = os.path.normpath(os.path.join(self.output_dir, relative_path, filename))
@@ -330,18 +1365,26 @@ class FileSet:
                 continue
 
             # Create directories only for files that will be extracted
-            os.makedirs(os.path.join(self.output_dir, relative_path), exist_ok=True)
+            options.names.ensure_dir(os.path.join(self.output_dir, relative_path))
 
             # Handle empty files
             if (offset_name != 0 and chunk_name != 0 and (real_offset is None or size == 0)):
                 try:
                     output_path = self._get_unique_filepath(os.path.join(self.output_dir, relative_path), filename)
-                    with open(output_path, 'wb') as f:
-                        pass
-                    output_display_path = os.path.relpath(output_path, start=os.path.dirname(self.base_output_dir))
-                    print(f"Extracting: .\\{output_display_path}")
+                    if file_type in ('res', 'rtbl') and not options.write_containers:
+                        self.reserved_paths.add(output_path)
+                        self.nested_data[output_path] = b''
+                    else:
+                        if options.journal is not None:
+                            options.journal.intend([output_path])
+                        with open(output_path, 'wb') as f:
+                            pass
+                        output_display_path = os.path.relpath(output_path, start=os.path.dirname(self.base_output_dir))
+                        print(f"Extracting: .\\{output_display_path}")
+                        self._record_entry(index, output_path, hashlib.md5().hexdigest())
                     if file_type in ('res', 'rtbl'):
                         self.nested_res_files.append(output_path)
+                        nested_order[output_path] = index
                 except Exception as e:
                     print(f"Skipping: {display_path} (Extraction error: {str(e)})")
                 continue
@@ -351,194 +1394,1143 @@ class FileSet:
                 print(f"Skipping: {display_path} (Invalid offset)")
                 continue
 
-            # Determine and verify source
-            source_file = self.input_file
+            # Determine and verify source (RDP paths are looked up once and kept open in RDP_POOL)
             if address_mode in (0x40, 0x50, 0x60):
-                rdp_file = self.rdp_files.get(address_mode)
-                rdp_path = os.path.join(SCRIPT_DIR, rdp_file)
-                if not os.path.exists(rdp_path):
-                    print(f"Skipping: {display_path} (RDP file {rdp_file} not found)")
+                source_file = RDP_POOL.resolve(address_mode, self.options.rdp_dir)
+                if source_file is None:
+                    print(f"Skipping: {display_path} (RDP file {self.rdp_files.get(address_mode)} not found)")
                     continue
-                source_file = rdp_path
 
-            # Extract and process chunk
-            try:
-                with open(source_file, 'rb') as f:
-                    f.seek(real_offset)
-                    chunk_data = f.read(size)
-                    if size > 0 and len(chunk_data) != size:
-                        print(f"Skipping: {display_path} (Chunk size mismatch)")
-                        continue
-
-                    # Check for BLZ2/BLZ4 headers on chunks if it's compressed
-                    final_data = chunk_data
-                    if size >= 4:
-                        header = chunk_data[:4]
-                        if header == BLZ2_HEADER:
-                            try:
-                                final_data = self._decompress_blz2(chunk_data)
-                                is_decompressed = True
-                            except Exception as e:
-                                print(f"Skipping: {display_path} (BLZ2 decompression error: {str(e)})")
-                                continue
-                        elif struct.unpack('<I', header)[0] == BLZ4_HEADER:
-                            try:
-                                final_data = self._decompress_blz4(chunk_data)
-                                is_decompressed = True
-                            except Exception as e:
-                                print(f"Skipping: {display_path} (BLZ4 decompression error: {str(e)})")
-                                continue
-
-                    # Write data
-                    output_path = self._get_unique_filepath(os.path.join(self.output_dir, relative_path), filename, is_decompressed)
-                    with open(output_path, 'wb') as f:
-                        f.write(final_data)
-                    output_display_path = os.path.relpath(output_path, start=os.path.dirname(self.base_output_dir))
-                    print(f"Extracting: .\\{output_display_path}")
-
-                    if file_type in ('res', 'rtbl') or os.path.splitext(output_path)[1].lower() in ('.res', '.rtbl'):
-                        self.nested_res_files.append(output_path)
-
-            except Exception as e:
-                print(f"Skipping: {display_path} (Extraction error: {str(e)})")
+            # Reserve the output name now so duplicates get numbered in TOC order, whatever order they're read in
+            output_path = self._get_unique_filepath(os.path.join(self.output_dir, relative_path), filename)
+            self.reserved_paths.add(output_path)
+            job = (index, output_path, display_path, file_type, size, fileset['unpack_size'])
+
+            # Aliases (another fileset here, in an earlier archive or a nested one already pointed at this exact
+            # range) are never read or decompressed again, they get fanned out from the first one's output.
+            # Not if that's an archive another worker is still on, or a nested archive that won't be written
+            # (no output to fan out): those just get read again.
+            source = source_file if address_mode in (0x40, 0x50, 0x60) else self.input_file
+            in_memory_only = not options.write_containers and is_nested_archive(file_type, output_path)
+            original = output_path if in_memory_only else options.ranges.setdefault((source, real_offset, size), output_path)
+            if options.journal is not None:
+                record = options.journal.check(output_path, *self._get_entry_range(index))
+                if record is not None:
+                    self._keep_unchanged(job, record, nested_order)
+                    continue
+            if original != output_path and (original in self.reserved_paths or original in options.finished):
+                aliases.append((job, original))
+                continue
+            if address_mode in (0x40, 0x50, 0x60):
+                unpack_size = None if self._keep_in_memory(job) else fileset['unpack_size']
+                rdp_requests.append((source_file, real_offset, size, unpack_size, job))
+            else:
+                local_jobs.append((job, real_offset))
+
+        if options.journal is not None:
+            options.journal.intend(path for _, _, path in self.reservations)
+
+        # Decompress + write, either right here or on the worker pool while the next chunks get read.
+        # Results are collected in submission order so the log and the output stay deterministic.
+        executor = options.get_executor()
+        dedup = options.dedup
+        hash_output = manifest is not None or dedup is not None
+        for job, original in aliases:
+            if original in options.finished:
+                self._link_duplicate(job, original, nested_order)
+            else:
+                self.waiting.setdefault(original, []).append(job)
+        pending = collections.deque()
+        write_containers = options.write_containers
 
+        def collect():
+            job, future = pending.popleft()
+            try:
+                self._finish_chunk(job, future.result(), nested_order)
+            finally:
+                options.chunk_slots.release()
+
+        try:
+            for job, chunk_data in self._iter_chunks(local_jobs, rdp_requests):
+                if dedup is not None and (write_containers or not is_nested_archive(job[3], job[1])) \
+                        and self._dedup_chunk(job, chunk_data, nested_order):
+                    continue
+                if executor is None:
+                    result = write_chunk(job, chunk_data, self.base_output_dir, hash_output, write_containers)
+                    self._finish_chunk(job, result, nested_order)
+                    continue
+                # The slots are shared with every other archive going: while this one has chunks of its own
+                # out it collects those instead of waiting, so it never sits on slots it could give back
+                while not options.chunk_slots.acquire(blocking=not pending):
+                    collect()
+                pending.append((job, executor.submit(write_chunk, job, chunk_data, self.base_output_dir, hash_output, write_containers)))
+        finally:
+            # Even if this archive failed halfway, its slots go back for the others
+            while pending:
+                collect()
+
+        # Whatever's still waiting points at something that never got written (a failed read)
+        for original, jobs in self.waiting.items():
+            for job in jobs:
+                self._link_duplicate(job, original, nested_order)
+        self.waiting.clear()
+
+        self.nested_res_files.sort(key=lambda path: nested_order.get(path, 0))
         return self.nested_res_files
 
-def parse_rtbl_file(file_path, base_output_dir):
+def parse_rtbl_filesets(file_data):
+    # Scans an RTBL buffer for its filesets, no extraction here
+    filesets = []
+    offset = 0
+    while offset < len(file_data):
+        # Read 16 bytes to check for non-zero data
+        if offset + 16 > len(file_data):
+            break
+        if struct.unpack_from('<QQ', file_data, offset) == (0, 0):
+            offset += 16
+            continue
+        # Need 32 bytes for a fileset
+        if offset + 32 > len(file_data):
+            print(f"Warning: Incomplete fileset at {hex(offset)}")
+            break
+        fileset_struct = FILESET_STRUCT.unpack_from(file_data, offset)
+        raw_offset = fileset_struct[0]
+        size = fileset_struct[1]
+        offset_name = fileset_struct[2]
+        chunk_name = fileset_struct[3]
+        unpack_size = fileset_struct[4]
+
+        # Validate fileset (offset_name should be 0x20)
+        if offset_name != 0x20:
+            offset += 16
+            continue
+
+        # Handle offset based on address mode
+        address_mode = (raw_offset & 0xFF000000) >> 24
+        real_offset = None
+        skip_reason = None
+
+        if address_mode == 0x00:
+            skip_reason = "Unknown address mode (0x00)"
+        elif address_mode == 0x30:
+            skip_reason = "DataSet file (0x30)"
+        elif address_mode in (0xC0, 0xD0): 
+            real_offset = raw_offset & 0x00FFFFFF
+        elif address_mode in (0x40, 0x50, 0x60):
+            temp_offset = raw_offset & 0x00FFFFFF
+            real_offset = temp_offset * 0x800
+
+        # Check for dummy fileset
+        if raw_offset == 0 and size == 0 and offset_name == 0 and chunk_name == 0 and unpack_size != 0:
+            skip_reason = "Dummy fileset"
+
+        # Read name and type
+        name_info = FileSet._read_rtbl_name_info(None, file_data, offset, chunk_name)
+        fileset_entry = {
+            'toc_offset': offset,
+            'raw_offset': raw_offset,
+            'real_offset': real_offset,
+            'size': size,
+            'offset_name': offset_name,
+            'chunk_name': chunk_name,
+            'unpack_size': unpack_size,
+            'address_mode': address_mode,
+            'name': name_info['name'],
+            'type': name_info['type'],
+            'directories': name_info['directories']
+        }
+
+        filesets.append((fileset_entry, skip_reason))
+        offset += 32
+    return filesets
+
+def read_archive_filesets(file_data, is_rtbl=False):
+    # Returns the (fileset, skip_reason) list of a .res or .rtbl buffer without extracting anything
+    if is_rtbl:
+        return parse_rtbl_filesets(file_data)
+    header = Header(file_data)
+    dataset = DataSet(file_data, header.group_count, header.group_offset)
+    return FileSet(file_data, dataset.datasets, None, None, None).filesets
+
+def find_rdp_path(address_mode, base_dir=None):
+    # Finds the RDP an address mode points to, next to the archive first and then next to the script
+    rdp_file = RDP_FILES.get(address_mode)
+    if rdp_file is None:
+        return None
+    for directory in (base_dir, SCRIPT_DIR):
+        if directory is not None:
+            rdp_path = os.path.join(directory, rdp_file)
+            if os.path.exists(rdp_path):
+                return rdp_path
+    return None
+
+def get_compression(chunk_header):
+    # 'blz2', 'blz4' or None depending on the first 4 bytes of a chunk
+    if len(chunk_header) < 4:
+        return None
+    if bytes(chunk_header[:4]) == BLZ2_HEADER:
+        return 'blz2'
+    if struct.unpack('<I', chunk_header[:4])[0] == BLZ4_HEADER:
+        return 'blz4'
+    return None
+
+def get_decompressed_data(chunk_data, unpack_size=None):
+    # Decompresses a chunk if it has a BLZ2/BLZ4 header, otherwise gives it back as is
+    # (BLZ2 has no size of its own, pass the fileset's unpack_size so it can be decoded in place)
+    compression = get_compression(chunk_data)
+    if compression == 'blz2':
+        return FileSet._decompress_blz2(None, chunk_data, unpack_size)
+    if compression == 'blz4':
+        return FileSet._decompress_blz4(None, chunk_data)
+    return chunk_data
+
+def read_fileset_chunk(fileset, archive_data, size, base_dir=None):
+    # First size bytes of a fileset's chunk: local entries (0xC0/0xD0) live inside the archive itself,
+    # the rest inside an RDP (None if that RDP isn't there)
+    real_offset = fileset['real_offset']
+    if fileset['address_mode'] in RDP_FILES:
+        rdp_path = RDP_POOL.resolve(fileset['address_mode'], base_dir)
+        if rdp_path is None:
+            return None
+        return RDP_POOL.read(rdp_path, real_offset, size)
+    return archive_data[real_offset:real_offset + size]
+
+def open_nested_archive(entry, archive_data, base_dir=None):
+    # walk_archive_tree's default way into a nested archive: read it whole and decompress it
+    fileset = entry['fileset']
+    chunk_data = read_fileset_chunk(fileset, archive_data, fileset['size'], base_dir)
+    if chunk_data is None:
+        return None
+    return get_decompressed_data(chunk_data, fileset['unpack_size'])
+
+def walk_archive_tree(archive_name, archive_data, is_rtbl=False, open_nested=None, names=None, base_dir=None):
+    # Walks a .res/.rtbl and every archive nested in it without writing anything, naming the entries
+    # exactly like extracting it does (with every RDP there): an archive's own entries first in TOC order,
+    # then its nested archives depth first, and _0001 names handed out per output folder by OutputNames,
+    # so a parent's file that lands in a nested archive's folder pushes the nested one to _0001 too.
+    # Yields a dict per fileset: index, fileset, skip_reason, is_empty, depth, archive (virtual path of
+    # the archive it's in: 'system.res', 'system.res/pack/nested.res'...) and archive_data (its buffer,
+    # what local entries are read from), path (the entry's virtual path)
+    # and output_path (where it gets extracted, relative to the top archive's folder, / separated).
+    # path and output_path are None for entries that don't get extracted.
+    # open_nested(entry, archive_data) gives back a nested archive's decompressed data (or None to not go
+    # into it), it's only called once the archive's own entries are all through. The default one reads
+    # them from the RDPs in base_dir (the top archive's folder).
+    if open_nested is None:
+        open_nested = lambda entry, data: open_nested_archive(entry, data, base_dir)
+    filesets = read_archive_filesets(archive_data, is_rtbl)
+    return _walk_archive_entries(archive_name, archive_data, filesets, open_nested,
+                                 names or OutputNames(scan_disk=False), '', 0)
+
+def _walk_archive_entries(archive_name, archive_data, filesets, open_nested, names, output_dir, depth):
+    nested = []
+    for index, (fileset, skip_reason) in enumerate(filesets):
+        real_offset = fileset['real_offset']
+        file_type = fileset['type']
+        filename = f"{fileset['name']}.{file_type}" if file_type else fileset['name']
+        is_empty = fileset['offset_name'] != 0 and fileset['chunk_name'] != 0 and (real_offset is None or fileset['size'] == 0)
+        entry = {
+            'index': index,
+            'fileset': fileset,
+            'skip_reason': skip_reason,
+            'is_empty': is_empty,
+            'depth': depth,
+            'archive': archive_name,
+            'archive_data': archive_data,
+            'path': None,
+            'output_path': None,
+        }
+        if not skip_reason and (real_offset is not None or is_empty):
+            directory = posixpath.join(output_dir, *fileset['directories'])
+            output_path = names.reserve(directory, filename).replace(os.sep, '/')
+            entry['output_path'] = output_path
+            entry['path'] = f"{archive_name}/{output_path[len(output_dir) + 1:] if output_dir else output_path}"
+            if file_type.lower() in ('res', 'rtbl') and not is_empty:
+                nested.append(entry)
+        yield entry
+
+    for entry in nested:
+        try:
+            nested_data = open_nested(entry, archive_data)
+            if nested_data is None:
+                continue
+            nested_filesets = read_archive_filesets(nested_data, entry['fileset']['type'].lower() == 'rtbl')
+        except Exception as e:
+            print(f"Warning: Could not read nested archive {entry['path']}: {e}")
+            continue
+        yield from _walk_archive_entries(entry['path'], nested_data, nested_filesets, open_nested, names,
+                                         posixpath.splitext(entry['output_path'])[0], depth + 1)
+
+# BLZ2 blocks hold at most 0xFFFF bytes each, same as RES_PACKER's LeCompression
+BLZ2_BLOCK_SIZE = 0xFFFF
+
+class _BLZ2BlockDeflater:
+    # One raw deflate stream per block. A class instead of a lambda so the settings pickle fine.
+    def __init__(self, level, strategy):
+        self.level = level
+        self.strategy = strategy
+
+    def __call__(self, block):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15, 8, self.strategy)
+        compressed_data = compressor.compress(block) + compressor.flush()
+        if len(compressed_data) > 0xFFFF:
+            raise ValueError(f"Compressed block is {len(compressed_data)} bytes, doesn't fit BLZ2's 16 bit block size")
+        return compressed_data
+
+def compress_blz2(data, level=zlib.Z_BEST_COMPRESSION, strategy=zlib.Z_DEFAULT_STRATEGY):
+    # BLZ2 Compression, same layout as LeCompression in the old C# RES_PACKER:
+    # the input is split into a head of len % 0xFFFF bytes (can be empty) followed by full 0xFFFF blocks,
+    # each deflated on its own (raw, no zlib header), then stored as
+    # blz2 | last full block | head | the other full blocks     (every block behind a u16 size)
+    # which is exactly what _decompress_blz2 undoes by moving the first stored block to the end.
+    # Blocks get compressed across the block pool. Incompressible blocks don't fit in a u16 and raise
+    # ValueError, store those files uncompressed instead.
+    view = memoryview(data)
+    head_size = len(view) % BLZ2_BLOCK_SIZE
+    blocks = [view[:head_size]]
+    blocks += [view[pos:pos + BLZ2_BLOCK_SIZE] for pos in range(head_size, len(view), BLZ2_BLOCK_SIZE)]
+    compressed_blocks = list(deflate_blocks(blocks, _BLZ2BlockDeflater(level, strategy)))
+
+    if len(compressed_blocks) > 1:
+        compressed_blocks = compressed_blocks[-1:] + compressed_blocks[:-1]
+    parts = [BLZ2_HEADER]
+    for compressed_data in compressed_blocks:
+        parts.append(struct.pack('<H', len(compressed_data)))
+        parts.append(compressed_data)
+    return b''.join(parts)
+
+
+# Uncompressed BLZ4 block size. Deflating 0x8000 bytes can never come out bigger than a u16.
+BLZ4_BLOCK_SIZE = 0x8000
+
+class _BLZ4BlockDeflater:
+    # zlib (with header) per block
+    def __init__(self, level):
+        self.level = level
+
+    def __call__(self, block):
+        return zlib.compress(block, self.level)
+
+def _blz4_size_field(compressed_data, is_last_stored):
+    # u16 in front of every BLZ4 block. Only the last stored block may be bigger than that:
+    # it gets size 0, which the decoder reads as "the rest of the chunk".
+    if len(compressed_data) <= 0xFFFF:
+        return struct.pack('<H', len(compressed_data))
+    if is_last_stored:
+        return b'\x00\x00'
+    raise ValueError(f"Compressed block is {len(compressed_data)} bytes, doesn't fit BLZ4's 16 bit block size")
+
+def _blz4_header(unpack_size, md5):
+    if unpack_size > 0xFFFFFFFF:
+        raise ValueError(f"{unpack_size} bytes is too big for BLZ4's 32 bit unpack size")
+    # magic, unpack_size (4), padding (8), md5 (16)
+    return struct.pack('<I I Q', BLZ4_HEADER, unpack_size, 0) + md5
+
+def compress_blz4(data, level=zlib.Z_BEST_COMPRESSION, block_size=BLZ4_BLOCK_SIZE):
+    # BLZ4 Compression, the container _decompress_blz4 reads:
+    # blz4 | unpack_size | padding | md5 | last block | block 0 | block 1 | ...   (every block behind a u16 size)
+    # Blocks are zlib streams of block_size bytes, compressed across the block pool.
+    view = memoryview(data)
+    blocks = [view[pos:pos + block_size] for pos in range(0, len(view), block_size)] or [view]
+    compressed_blocks = list(deflate_blocks(blocks, _BLZ4BlockDeflater(level)))
+    compressed_blocks = compressed_blocks[-1:] + compressed_blocks[:-1]
+
+    parts = [_blz4_header(len(view), hashlib.md5(view).digest())]
+    for block_number, compressed_data in enumerate(compressed_blocks, 1):
+        parts.append(_blz4_size_field(compressed_data, block_number == len(compressed_blocks)))
+        parts.append(compressed_data)
+    return b''.join(parts)
+
+def compress_blz4_to_file(src, out, level=zlib.Z_BEST_COMPRESSION, block_size=BLZ4_BLOCK_SIZE):
+    # compress_blz4 for files of any size: src (a seekable binary file) is read block by block,
+    # deflated a window of blocks at a time and written straight to out, with the MD5 updated as
+    # the blocks go by. The header is filled in at the end, so out has to be seekable for that;
+    # if it isn't (a pipe), src gets an extra MD5 pass first instead.
+    # Returns the number of bytes written.
+    unpack_size = src.seek(0, os.SEEK_END)
+    block_count = max(1, -(-unpack_size // block_size))
+    deflate = _BLZ4BlockDeflater(level)
+
+    def read_block(pos):
+        block = src.read(min(block_size, unpack_size - pos))
+        if len(block) != min(block_size, unpack_size - pos):
+            raise IOError("Input changed size while compressing")
+        return block
+
+    # The last block is stored first
+    last_pos = (block_count - 1) * block_size
+    src.seek(last_pos)
+    last_block = read_block(last_pos)
+
+    md5 = hashlib.md5()
+    header_pos = out.tell() if out.seekable() else None
+    if header_pos is None:
+        src.seek(0)
+        while True:
+            piece = src.read(STREAM_COPY_SIZE)
+            if not piece:
+                break
+            md5.update(piece)
+    out.write(_blz4_header(unpack_size, md5.digest() if header_pos is None else bytes(16)))
+    written = 32
+
+    compressed_data = deflate(last_block)
+    out.write(_blz4_size_field(compressed_data, block_count == 1))
+    out.write(compressed_data)
+    written += 2 + len(compressed_data)
+
+    def raw_blocks():
+        src.seek(0)
+        for pos in range(0, last_pos, block_size):
+            block = read_block(pos)
+            if header_pos is not None:
+                md5.update(block)
+            yield block
+
+    for block_number, compressed_data in enumerate(deflate_stream(raw_blocks(), deflate), 2):
+        out.write(_blz4_size_field(compressed_data, block_number == block_count))
+        out.write(compressed_data)
+        written += 2 + len(compressed_data)
+
+    if header_pos is not None:
+        md5.update(last_block)
+        out.seek(header_pos)
+        out.write(_blz4_header(unpack_size, md5.digest()))
+        out.seek(header_pos + written)
+    return written
+
+def parse_rtbl_file(file_path, base_output_dir, options=None, file_data=None):
     # Reads RTBL File type
-    # Maps out and gets the correct datas we need
-    if not os.path.exists(file_path):
+    # Maps out and gets the correct datas we need (file_data: it's nested and still in memory)
+    # Only extracts this one archive and gives back its FileSet (None if it failed), the nested
+    # archives it found are left to the NestedScheduler.
+    if file_data is None and not os.path.exists(file_path):
         raise FileNotFoundError(f"File {file_path} not found")
 
     output_dir = os.path.splitext(file_path)[0]
     
-    with open(file_path, 'rb') as f:
-        file_data = f.read()
-    
     try:
-        filesets = []
-        offset = 0
-        while offset < len(file_data):
-            # Read 16 bytes to check for non-zero data
-            if offset + 16 > len(file_data):
-                break
-            chunk = file_data[offset:offset+16]
-            if chunk == b'\x00' * 16:
-                offset += 16
-                continue
-            # Need 32 bytes for a fileset
-            if offset + 32 > len(file_data):
-                print(f"Warning: Incomplete fileset at {hex(offset)}")
-                break
-            fileset_data = file_data[offset:offset+32]
-            fileset_struct = struct.unpack('<I I I I 12x I', fileset_data)
-            raw_offset = fileset_struct[0]
-            size = fileset_struct[1]
-            offset_name = fileset_struct[2]
-            chunk_name = fileset_struct[3]
-            unpack_size = fileset_struct[4]
-
-            # Validate fileset (offset_name should be 0x20)
-            if offset_name != 0x20:
-                offset += 16
-                continue
-
-            # Handle offset based on address mode
-            address_mode = (raw_offset & 0xFF000000) >> 24
-            real_offset = None
-            skip_reason = None
-
-            if address_mode == 0x00:
-                skip_reason = "Unknown address mode (0x00)"
-            elif address_mode == 0x30:
-                skip_reason = "DataSet file (0x30)"
-            elif address_mode in (0xC0, 0xD0): 
-                real_offset = raw_offset & 0x00FFFFFF
-            elif address_mode in (0x40, 0x50, 0x60):
-                temp_offset = raw_offset & 0x00FFFFFF
-                real_offset = temp_offset * 0x800
-
-            # Check for dummy fileset
-            if raw_offset == 0 and size == 0 and offset_name == 0 and chunk_name == 0 and unpack_size != 0:
-                skip_reason = "Dummy fileset"
-
-            # Read name and type
-            name_info = FileSet._read_rtbl_name_info(None, file_data, offset, chunk_name)
-            fileset_entry = {
-                'raw_offset': raw_offset,
-                'real_offset': real_offset,
-                'size': size,
-                'offset_name': offset_name,
-                'chunk_name': chunk_name,
-                'unpack_size': unpack_size,
-                'address_mode': address_mode,
-                'name': name_info['name'],
-                'type': name_info['type'],
-                'directories': name_info['directories']
+        with ArchiveReader(file_path, file_data) as reader:
+            filesets = parse_rtbl_filesets(reader.data)
+
+            # Create a FileSet instance to extract files
+            fileset = FileSet.__new__(FileSet)
+            fileset.filesets = filesets
+            fileset.input_file = file_path
+            fileset.output_dir = output_dir
+            fileset.base_output_dir = base_output_dir
+            fileset.rdp_files = {
+                0x40: 'package.rdp',
+                0x50: 'data.rdp',
+                0x60: 'patch.rdp'
             }
+            fileset.nested_res_files = []
+            fileset.nested_data = {}
+            fileset.file_data = reader.data
+            fileset.options = options if options is not None else ExtractOptions()
+            fileset.extract_files()
+        return fileset
 
-            filesets.append((fileset_entry, skip_reason))
-            offset += 32
+    except Exception as e:
+        print(f"Error processing {file_path}: {str(e)}")
+        return None
 
-        # Create a FileSet instance to extract files
-        fileset = FileSet.__new__(FileSet)
-        fileset.filesets = filesets
-        fileset.input_file = file_path
-        fileset.output_dir = output_dir
-        fileset.base_output_dir = base_output_dir
-        fileset.rdp_files = {
-            0x40: 'package.rdp',
-            0x50: 'data.rdp',
-            0x60: 'patch.rdp'
-        }
-        fileset.nested_res_files = []
-        nested_res_files = fileset.extract_files()
+def extract_archive(file_path, base_output_dir, options, file_data=None):
+    # Extracts one .res/.rtbl (from file_data if it's a nested one still in memory) without going into
+    # the archives nested in it. Returns its FileSet, or None if it couldn't be processed.
+    if file_path.lower().endswith('.rtbl'):
+        return parse_rtbl_file(file_path, base_output_dir, options, file_data)
+
+    output_dir = os.path.splitext(file_path)[0]
+    try:
+        # Map the file instead of reading it, names get resolved straight out of the mapping
+        with ArchiveReader(file_path, file_data) as reader:
+            file_data = reader.data
 
-        # Process nested .res and .rtbl files
-        for nested_file in nested_res_files:
-            parse_res_file(nested_file, base_output_dir)
+            # Parse header
+            header = Header(file_data)
+
+            # Parse datasets
+            dataset = DataSet(file_data, header.group_count, header.group_offset)
+
+            # Parse and extract filesets
+            fileset = FileSet(file_data, dataset.datasets, file_path, output_dir, base_output_dir, options)
+            fileset.extract_files()
+        return fileset
 
     except Exception as e:
         print(f"Error processing {file_path}: {str(e)}")
+        return None
+
+
+# Bumped whenever the plan layout changes, and how much of the tree a plan reads to time it
+PLAN_VERSION = 2
+PLAN_SAMPLE_BYTES = 0x1000000
+
+class ExtractPlan:
+    # What extracting a .res tree is going to take, worked out before anything gets written: bytes to read
+    # per RDP (aliased ranges counted once, they're only read once), how many entries are BLZ2/BLZ4/raw,
+    # the projected output size (unpack_size for compressed entries), which RDPs are missing and a duration
+    # estimate from timing a sample of the actual entries.
+    # Building it reads the TOCs, the first 4 bytes of every entry and the nested archives (to get at their
+    # TOCs), nothing else. to_dict()/from_dict() round trip through JSON with every entry in it, so a plan
+    # can be saved and handed out to workers in pieces.
+    def __init__(self, res_path, write_containers=True):
+        self.res_path = os.path.abspath(res_path)
+        self.output_dir = os.path.splitext(self.res_path)[0]
+        self.base_dir = os.path.dirname(self.res_path)  # where RDPs are looked for first
+        self.write_containers = write_containers
+        self.archives = []      # virtual path of every archive in the tree, system.res first
+        self.entries = []       # [virtual path, source (RDP name or archive virtual path), offset, size, unpack_size, compression]
+        self.skipped = 0
+        self.missing_rdps = {}  # RDP name -> how many entries need it
+        self.seconds_per_byte = {}  # 'raw'/'compressed' -> measured seconds per stored byte
+
+    def build(self, measure=True):
+        with ArchiveReader(self.res_path) as reader:
+            self._walk(os.path.basename(self.res_path), reader.data, self.res_path.lower().endswith('.rtbl'))
+        if measure:
+            self.measure()
+        return self
+
+    def _walk(self, archive_path, archive_data, is_rtbl):
+        # Entries are named by walk_archive_tree, so every virtual path is unique (the _0001 names
+        # extraction gives duplicates) and a piece of the plan says exactly which outputs it covers
+        for entry in walk_archive_tree(archive_path, archive_data, is_rtbl, base_dir=self.base_dir):
+            if entry['archive'] not in self.archives:
+                self.archives.append(entry['archive'])
+            fileset = entry['fileset']
+            virtual_path = entry['path']
+            if virtual_path is None:
+                self.skipped += 1
+                continue
+            rdp = RDP_FILES.get(fileset['address_mode'])
+            if rdp is not None and not entry['is_empty'] and RDP_POOL.resolve(fileset['address_mode'], self.base_dir) is None:
+                self.missing_rdps[rdp] = self.missing_rdps.get(rdp, 0) + 1
+                continue
 
-def parse_res_file(file_path, base_output_dir=None):
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"File {file_path} not found")
+            compression = None
+            if not entry['is_empty']:
+                try:
+                    compression = get_compression(read_fileset_chunk(fileset, entry['archive_data'], min(fileset['size'], 4),
+                                                                     self.base_dir))
+                except OSError as e:
+                    print(f"Warning: Could not read {virtual_path}: {e}")
+            self.entries.append([virtual_path, rdp or entry['archive'], fileset['real_offset'], fileset['size'],
+                                 fileset['unpack_size'], compression])
+
+    def read_bytes(self):
+        # Source -> bytes that get read from it
+        ranges = {(source, offset, size) for _, source, offset, size, _, _ in self.entries if size}
+        totals = collections.Counter()
+        for source, _, size in ranges:
+            totals[source if source in RDP_FILES.values() else 'local'] += size
+        return dict(totals)
+
+    def compression_counts(self):
+        return dict(collections.Counter(compression or 'raw' for *_, compression in self.entries))
+
+    def output_bytes(self):
+        total = 0
+        for virtual_path, _, _, size, unpack_size, compression in self.entries:
+            if not self.write_containers and os.path.splitext(virtual_path)[1].lower() in ('.res', '.rtbl'):
+                continue
+            total += unpack_size if compression is not None else size
+        return total
+
+    def measure(self, sample_bytes=PLAN_SAMPLE_BYTES):
+        # Reads (and decompresses) evenly spread RDP entries, up to sample_bytes of each kind, and keeps the
+        # time it took per stored byte. A guess that ignores the page cache, but a measured one.
+        for kind in ('raw', 'compressed'):
+            candidates = [entry for entry in self.entries
+                          if entry[1] in RDP_FILES.values() and entry[3] and (entry[5] is None) == (kind == 'raw')]
+            if not candidates:
+                continue
+            step = max(1, len(candidates) * sum(entry[3] for entry in candidates[:64]) // (64 * sample_bytes) or 1)
+            sampled = 0
+            start = time.perf_counter()
+            for _, source, offset, size, unpack_size, _ in candidates[::step]:
+                address_mode = next(mode for mode, name in RDP_FILES.items() if name == source)
+                chunk_data = RDP_POOL.read(RDP_POOL.resolve(address_mode, self.base_dir), offset, size)
+                if kind == 'compressed':
+                    get_decompressed_data(chunk_data, unpack_size)
+                sampled += size
+                if sampled >= sample_bytes:
+                    break
+            self.seconds_per_byte[kind] = (time.perf_counter() - start) / sampled
+
+    def estimated_seconds(self, jobs=1):
+        # Raw entries are bound by reading, compressed ones by inflating (which spreads over the jobs)
+        if not self.seconds_per_byte:
+            return None
+        raw = sum(entry[3] for entry in self.entries if entry[5] is None)
+        compressed = sum(entry[3] for entry in self.entries if entry[5] is not None)
+        seconds = raw * self.seconds_per_byte.get('raw', 0)
+        seconds += compressed * self.seconds_per_byte.get('compressed', 0) / max(1, min(jobs, os.cpu_count() or 1))
+        return seconds
+
+    def free_space(self):
+        # Free bytes on the volume the output goes to (the closest folder that already exists)
+        path = self.output_dir
+        while not os.path.isdir(path) and os.path.dirname(path) != path:
+            path = os.path.dirname(path)
+        return shutil.disk_usage(path).free
+
+    def check_space(self):
+        # Raises before anything gets written if the output can't fit
+        needed, free = self.output_bytes(), self.free_space()
+        if needed > free:
+            raise OSError(f"Not enough space for {self.output_dir}: needs {needed} bytes, {free} free")
+
+    def to_dict(self):
+        return {
+            'version': PLAN_VERSION,
+            'res_path': self.res_path,
+            'write_containers': self.write_containers,
+            'archives': self.archives,
+            'entries': self.entries,
+            'skipped': self.skipped,
+            'missing_rdps': self.missing_rdps,
+            'seconds_per_byte': self.seconds_per_byte,
+        }
 
-    output_dir = os.path.splitext(file_path)[0]
-    # Use base_output_dir from main .res file, or set it for the first call
-    if base_output_dir is None:
-        base_output_dir = output_dir
-    
-    # Check if it's an .rtbl file
-    if file_path.lower().endswith('.rtbl'):
-        parse_rtbl_file(file_path, base_output_dir)
-        return
+    @classmethod
+    def from_dict(cls, data):
+        if data.get('version') != PLAN_VERSION:
+            raise ValueError("Plan is from an incompatible version")
+        plan = cls(data['res_path'], data['write_containers'])
+        plan.archives = data['archives']
+        plan.entries = data['entries']
+        plan.skipped = data['skipped']
+        plan.missing_rdps = data['missing_rdps']
+        plan.seconds_per_byte = data['seconds_per_byte']
+        return plan
+
+    def print_summary(self, jobs=1):
+        print(f"Plan for {self.res_path}: {len(self.entries)} entries in {len(self.archives)} archive(s), {self.skipped} skipped")
+        for source, size in sorted(self.read_bytes().items()):
+            print(f"  read {size} bytes from {source}")
+        print("  " + ", ".join(f"{count} {kind}" for kind, count in sorted(self.compression_counts().items())))
+        print(f"  output: {self.output_bytes()} bytes ({self.free_space()} free)")
+        for rdp, count in sorted(self.missing_rdps.items()):
+            print(f"  missing {rdp}: {count} entries will be skipped")
+        seconds = self.estimated_seconds(jobs)
+        if seconds is not None:
+            print(f"  estimated time: {seconds:.1f}s with {jobs} job(s)")
+
+def save_plan(plan, plan_path):
+    with open(plan_path, 'w', encoding='utf-8') as f:
+        json.dump(plan.to_dict(), f)
+
+def load_plan(plan_path):
+    with open(plan_path, 'r', encoding='utf-8') as f:
+        return ExtractPlan.from_dict(json.load(f))
+
+
+# Bumped whenever the verify report layout changes
+VERIFY_VERSION = 1
+
+def verify_chunk(chunk, unpack_size, keep_data=False):
+    # Decodes a chunk without writing it anywhere and gives back (problems, data). chunk is a ChunkRef or
+    # a buffer. BLZ2/BLZ4 blocks are inflated one at a time, so memory stays at one block, and checked for
+    # a clean end, the total against unpack_size (and the BLZ4 header's own size) and the BLZ4 MD5.
+    # data is only kept (decompressed) when keep_data is set, for nested archives.
+    if isinstance(chunk, ChunkRef):
+        read, chunk_size = chunk.read, chunk.size
+    else:
+        read, chunk_size = (lambda offset, size: chunk[offset:offset + size]), len(chunk)
+    compression = get_compression(read(0, 4))
+    if compression is None:
+        return [], (bytes(read(0, chunk_size)) if keep_data else None)
+
+    problems = []
+    try:
+        blocks, header_unpack_size, md5 = scan_blz_blocks(read, chunk_size, compression)
+    except ValueError as e:
+        return [str(e)], None
+    if header_unpack_size is not None and header_unpack_size != unpack_size:
+        problems.append(f"BLZ4 header says {header_unpack_size} bytes, TOC says {unpack_size}")
+
+    digest = hashlib.md5() if md5 is not None else None
+    output = bytearray() if keep_data else None
+    written = 0
+    # stored order is block 0 (the end of the output) and then the rest from the start
+    for index in (*range(1, len(blocks)), 0):
+        offset, size = blocks[index]
+        try:
+            if compression == 'blz4':
+                decompressed_data = _inflate_blz4_block(read(offset, size))
+            else:
+                decompressed_data, has_unused_data, is_eof = _inflate_blz2_block(read(offset, size))
+                if has_unused_data:
+                    problems.append(f"Unused data after block {index + 1}")
+                if not is_eof:
+                    problems.append(f"Block {index + 1} is incomplete")
+        except (ValueError, zlib.error) as e:
+            problems.append(f"Block {index + 1}: {e}")
+            return problems, None
+        written += len(decompressed_data)
+        if digest is not None:
+            digest.update(decompressed_data)
+        if output is not None:
+            output += decompressed_data
+
+    if written != unpack_size:
+        problems.append(f"Decoded {written} bytes, TOC says {unpack_size}")
+    if digest is not None and digest.digest() != md5:
+        problems.append("BLZ4 MD5 checksum mismatch")
+    return problems, output
+
+class ArchiveVerifier:
+    # Checks every entry of a .res tree without extracting it: TOC bounds against the RDP (or archive)
+    # length, then every BLZ2/BLZ4 stream decoded through verify_chunk. The tree is walked with
+    # walk_archive_tree, the entries are decoded on a pool (threads, zlib lets go of the GIL; or processes, ChunkRefs are cheap to send).
+    # Nested archives are decoded on the walking thread since their TOCs are needed to keep going.
+    # The report is plain JSON: totals plus one record per entry that has a problem.
+    def __init__(self, res_path, jobs=None, use_processes=False):
+        self.res_path = os.path.abspath(res_path)
+        self.base_dir = os.path.dirname(self.res_path)  # where RDPs are looked for first
+        self.jobs = jobs or os.cpu_count() or 1
+        self.use_processes = use_processes
+        self.entries = 0
+        self.compressed = 0
+        self.checked_bytes = 0
+        self.skipped = 0
+        self.missing_rdps = {}
+        self.bad = []
+        self.rdp_sizes = {}
+        self.nested = {}  # virtual path -> record of a nested archive the walk hasn't opened yet
+
+    def run(self):
+        start = time.perf_counter()
+        pool_class = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+        with pool_class(max_workers=self.jobs) as executor:
+            self.executor = executor
+            self.pending = collections.deque()
+            with ArchiveReader(self.res_path) as reader:
+                self._walk(os.path.basename(self.res_path), reader.data, self.res_path.lower().endswith('.rtbl'))
+            while self.pending:
+                self._collect(*self.pending.popleft())
+        self.seconds = time.perf_counter() - start
+        return self
+
+    def _collect(self, record, future):
+        problems, _ = future.result()
+        self._finish(record, problems)
+
+    def _finish(self, record, problems):
+        self.entries += 1
+        if problems:
+            self.bad.append(dict(record, problems=problems))
+
+    def _submit(self, record, chunk):
+        # Keeps at most a few entries per worker in flight, chunks from memory archives are copies
+        self.pending.append((record, self.executor.submit(verify_chunk, chunk, record['unpack_size'])))
+        while len(self.pending) > 4 * self.jobs:
+            self._collect(*self.pending.popleft())
+
+    def _walk(self, archive_path, archive_data, is_rtbl):
+        # Named by walk_archive_tree, so a report path is the entry's own (duplicates get the _0001 names
+        # extraction gives them). Nested archives are checked when the walk opens them, after their parent's
+        # entries, and only if the parent had them in bounds.
+        for entry in walk_archive_tree(archive_path, archive_data, is_rtbl, self._open_nested):
+            fileset = entry['fileset']
+            real_offset = fileset['real_offset']
+            size = fileset['size']
+            if entry['path'] is None or real_offset is None or size == 0:
+                self.skipped += 1
+                continue
+            rdp = RDP_FILES.get(fileset['address_mode'])
+            record = {
+                'path': entry['path'],
+                'source': rdp or entry['archive'],
+                'offset': real_offset,
+                'size': size,
+                'unpack_size': fileset['unpack_size'],
+            }
 
-    with open(file_path, 'rb') as f:
-        file_data = f.read()
+            if rdp is not None:
+                rdp_path = RDP_POOL.resolve(fileset['address_mode'], self.base_dir)
+                if rdp_path is None:
+                    self.missing_rdps[rdp] = self.missing_rdps.get(rdp, 0) + 1
+                    continue
+                if rdp_path not in self.rdp_sizes:
+                    self.rdp_sizes[rdp_path] = os.path.getsize(rdp_path)
+                source_size = self.rdp_sizes[rdp_path]
+            else:
+                source_size = len(entry['archive_data'])
+            if real_offset + size > source_size:
+                self._finish(record, [f"Ends at {real_offset + size}, past the end of {record['source']} ({source_size} bytes)"])
+                continue
 
-    try:
-        # Parse header
-        header = Header(file_data)
+            self.checked_bytes += size
+            chunk = self._chunk(entry)
+            if get_compression(chunk.read(0, 4) if rdp is not None else chunk[:4]) is not None:
+                self.compressed += 1
 
-        # Parse datasets
-        dataset = DataSet(file_data, header.group_count, header.group_offset)
+            if fileset['type'].lower() in ('res', 'rtbl'):
+                self.nested[entry['path']] = record
+            else:
+                self._submit(record, chunk)
+
+    def _chunk(self, entry):
+        fileset = entry['fileset']
+        real_offset, size = fileset['real_offset'], fileset['size']
+        if fileset['address_mode'] in RDP_FILES:
+            return ChunkRef(RDP_POOL.resolve(fileset['address_mode'], self.base_dir), real_offset, size)
+        return bytes(entry['archive_data'][real_offset:real_offset + size])
+
+    def _open_nested(self, entry, archive_data):
+        # Decoded on the walking thread, its TOC is needed to keep going
+        record = self.nested.pop(entry['path'], None)
+        if record is None:
+            return None
+        problems, nested_data = verify_chunk(self._chunk(entry), record['unpack_size'], keep_data=True)
+        if nested_data is not None:
+            try:
+                read_archive_filesets(nested_data, entry['fileset']['type'].lower() == 'rtbl')
+            except Exception as e:
+                problems.append(f"Could not read nested archive: {e}")
+                nested_data = None
+        self._finish(record, problems)
+        return nested_data
+
+    def report(self):
+        return {
+            'version': VERIFY_VERSION,
+            'res_path': self.res_path,
+            'entries': self.entries,
+            'compressed': self.compressed,
+            'checked_bytes': self.checked_bytes,
+            'skipped': self.skipped,
+            'missing_rdps': self.missing_rdps,
+            'bad': sorted(self.bad, key=lambda record: record['path']),
+            'seconds': round(self.seconds, 3),
+        }
 
-        # Parse and extract filesets
-        fileset = FileSet(file_data, dataset.datasets, file_path, output_dir, base_output_dir)
-        nested_res_files = fileset.extract_files()
+    def print_summary(self):
+        for record in sorted(self.bad, key=lambda record: record['path']):
+            for problem in record['problems']:
+                print(f"Bad: {record['path']}: {problem}")
+        for rdp, count in sorted(self.missing_rdps.items()):
+            print(f"Missing {rdp}: {count} entries not checked")
+        print(f"Verified {self.entries} entries ({self.compressed} compressed, {self.checked_bytes} bytes) "
+              f"in {self.seconds:.1f}s: {len(self.bad)} bad, {self.skipped} skipped")
+
+
+class NestedTask:
+    # One archive for the NestedScheduler: where it is, its data if it's still in memory, and the
+    # bookkeeping for knowing when it and everything nested under it is done
+    def __init__(self, file_path, file_data, parent, digest=None):
+        self.file_path = file_path
+        self.file_data = file_data
+        self.parent = parent
+        self.digest = digest    # MD5 of the archive, for spotting the same archive twice
+        self.same_as = None     # the task with the same contents this one gets copied from
+        self.remaining = 1      # itself + nested tasks not done yet
+        self.waiting = []       # tasks with the same contents, waiting for this whole subtree
+        self.reservations = []  # (folder relative to its output folder, name asked for, path it got)
+        self.children = []      # nested tasks in TOC order
+
+
+class NestedScheduler:
+    # Runs a .res/.rtbl and everything nested in it as a queue of tasks instead of recursing:
+    # an archive's FileSet (and its buffer) is gone as soon as it's extracted, its nested archives
+    # get queued. options.jobs workers take tasks from the queue, last in first out, so a single
+    # worker goes depth first in TOC order like the old recursion did.
+    # Nested archives are kept in memory up to options.memory_budget bytes in total (counted as soon as
+    # they're decompressed, see ExtractOptions.hold_nested), past that they're spilled to their output
+    # file and mapped from there when their turn comes.
+    # The same archive twice (by MD5, like processed_files in the old PRES_Loader) is only extracted
+    # once, the other copies get its output tree copied over (linked with --dedup). One that contains
+    # itself somewhere down its own tree is skipped instead of looping forever.
+    def __init__(self, options):
+        self.options = options
+        self.condition = threading.Condition()
+        self.queue = []
+        self.running = 0
+        self.archives = {}      # MD5 -> first task with those contents
+
+    def run(self, file_path, base_output_dir, file_data=None):
+        self.base_output_dir = base_output_dir
+        self.queue.append(NestedTask(file_path, file_data, None))
+        if self.options.jobs == 1:
+            self._work()
+            return
+        workers = [threading.Thread(target=self._work) for _ in range(self.options.jobs)]
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                worker.join()
+        except BaseException:
+            # Ctrl-C: the workers finish the archive they're on and don't pick up anything new
+            with self.condition:
+                self.queue.clear()
+                self.condition.notify_all()
+            for worker in workers:
+                worker.join()
+            raise
+
+    def _work(self):
+        while True:
+            with self.condition:
+                while not self.queue and self.running:
+                    self.condition.wait()
+                if not self.queue:
+                    self.condition.notify_all() # nothing left and nothing running that could add more
+                    return
+                task = self.queue.pop()
+                self.running += 1
+            try:
+                if task.same_as is not None:
+                    self._copy_tree(task)
+                else:
+                    self._extract(task)
+                self._task_done(task)
+            finally:
+                with self.condition:
+                    self.running -= 1
+                    self.condition.notify_all()
+
+    def _extract(self, task):
+        options = self.options
+        fileset = extract_archive(task.file_path, self.base_output_dir, options, task.file_data)
+        if task.file_data is not None:
+            if task.parent is not None: # the top archive's data is the caller's, it was never counted
+                options.release_nested(len(task.file_data))
+            task.file_data = None
+        elif task.parent is not None and not options.write_containers and os.path.exists(task.file_path):
+            os.remove(task.file_path) # only written because it couldn't stay in memory
+        if fileset is None:
+            return
+
+        output_dir = os.path.splitext(task.file_path)[0]
+        task.reservations = [(os.path.relpath(directory, output_dir), filename, path)
+                             for directory, filename, path in fileset.reservations]
+        nested_tasks = []
+        for nested_file in fileset.nested_res_files:
+            nested_task = self._make_task(nested_file, fileset.nested_data.pop(nested_file, None), task)
+            if nested_task is not None:
+                nested_tasks.append(nested_task)
+        task.children = nested_tasks
+        with self.condition:
+            task.remaining += len(nested_tasks)
+            for nested_task in reversed(nested_tasks): # the first one in TOC order gets picked up first
+                if nested_task.same_as is None or nested_task.same_as.remaining == 0:
+                    self.queue.append(nested_task)
+                else:
+                    nested_task.same_as.waiting.append(nested_task)
+            self.condition.notify_all()
+
+    def _make_task(self, file_path, file_data, parent):
+        # A task for a nested archive, or None if it's one of its own ancestors.
+        # file_data is already counted against the memory budget, dropping it gives that back.
+        try:
+            digest = hashlib.md5(file_data).hexdigest() if file_data is not None else hash_file(file_path)
+        except OSError as e:
+            print(f"Error processing {file_path}: {str(e)}")
+            return None
+        task = NestedTask(file_path, file_data, parent, digest)
+        ancestor = parent
+        while ancestor is not None:
+            if ancestor.digest == digest:
+                print(f"Skipping: {self._display(file_path)} (contains itself)")
+                self._drop_container(task)
+                return None
+            ancestor = ancestor.parent
+
+        with self.condition:
+            same_as = self.archives.setdefault(digest, task)
+        if same_as is not task:
+            task.same_as = same_as
+            self._drop_container(task)
+        return task
+
+    def _drop_container(self, task):
+        # A nested archive that won't be extracted itself doesn't need to be around as a file either,
+        # unless containers are being written
+        if task.file_data is not None:
+            self.options.release_nested(len(task.file_data))
+        task.file_data = None
+        if not self.options.write_containers and os.path.exists(task.file_path):
+            os.remove(task.file_path)
+
+    def _task_done(self, task):
+        # Counts a task off, and its parent too once its whole subtree is through
+        with self.condition:
+            while task is not None:
+                task.remaining -= 1
+                if task.remaining:
+                    break
+                self.queue.extend(task.waiting) # queued last TOC first, so the first one is popped first
+                task.waiting = []
+                task = task.parent
+            self.condition.notify_all()
+
+    def _source_name(self, path):
+        # How manifest/journal records name an archive as the source of their entries
+        return os.path.relpath(path, os.path.dirname(self.base_output_dir)).replace(os.sep, '/')
+
+    def _display(self, path):
+        return '.\\' + os.path.relpath(path, start=os.path.dirname(self.base_output_dir))
+
+    def _copy_tree(self, task):
+        # Gives an archive seen before the same output as the first one, without extracting it again.
+        # The names the first one's subtree asked for are asked for again in the same order (its own
+        # entries, then its nested archives depth first), so they're numbered exactly as extracting this
+        # copy would number them, and only what the first one really wrote gets copied (or linked) over.
+        # Manifest and journal entries come along, their sources moved to this copy's archives.
+        sources = {self._source_name(task.same_as.file_path): self._source_name(task.file_path)}
+        self._replay(task.same_as, os.path.splitext(task.file_path)[0], sources)
+
+    def _replay(self, source_task, output_dir, sources):
+        options = self.options
+        journal = options.journal
+        copied = {}
+        for relative_dir, filename, source_path in source_task.reservations:
+            directory = os.path.normpath(os.path.join(output_dir, relative_dir))
+            options.names.ensure_dir(directory)
+            copied[source_path] = options.names.reserve(directory, filename, journal)
+        if journal is not None:
+            journal.intend(copied.values())
+
+        for source_path, output_path in copied.items():
+            if not os.path.isfile(source_path) or options.finished.get(source_path, True) is None:
+                continue # never written (failed, or a container that only lived in memory)
+            # --resume: a copy that's still what the first one's record says is left alone, like any output
+            record = self._copied_record(source_path, sources)
+            if record is not None and journal.check(output_path, record['source'], record['offset'],
+                                                    record['stored_size'], record['unpack_size']) is not None:
+                print(f"Unchanged: {self._display(output_path)}")
+                options.finished[output_path] = options.finished.get(source_path, True)
+                self._copy_records(source_path, output_path, sources, None)
+                continue
+            try:
+                how = link_duplicate(source_path, output_path, options.dedup or 'copy')
+            except Exception as e:
+                print(f"Skipping: {self._display(output_path)} (Extraction error: {str(e)})")
+                continue
+            print(f"Extracting: {self._display(output_path)} ({how} of {self._display(source_path)})")
+            options.finished[output_path] = options.finished.get(source_path, True)
+            if options.dedup is not None:
+                options.dedup_links.append((source_path, output_path, os.path.getsize(output_path), how))
+            self._copy_records(source_path, output_path, sources, record)
+
+        for child in source_task.children:
+            child_path = copied.get(child.file_path)
+            if child_path is None:
+                continue
+            sources[self._source_name(child.file_path)] = self._source_name(child_path)
+            self._replay(child.same_as or child, os.path.splitext(child_path)[0], sources)
+
+    def _copied_record(self, source_path, sources):
+        # The journal record of a copied file: the first one's, pointing at the copy's archive instead
+        journal = self.options.journal
+        record = journal.entries.get(journal._key(source_path)) if journal is not None else None
+        if record is None:
+            return None
+        return dict(record, source=sources.get(record['source'], record['source']))
+
+    def _copy_records(self, source_path, output_path, sources, journal_record):
+        # The manifest entry of a copied file (pointing at the copy's archive) and its journal record
+        options = self.options
+        if options.manifest is not None:
+            record = options.manifest.get(os.path.relpath(source_path, self.base_output_dir).replace(os.sep, '/'))
+            if record is not None:
+                stat = os.stat(output_path)
+                options.manifest[os.path.relpath(output_path, self.base_output_dir).replace(os.sep, '/')] = dict(
+                    record, source=sources.get(record['source'], record['source']), size=stat.st_size,
+                    mtime_ns=stat.st_mtime_ns)
+        if journal_record is not None:
+            options.journal.record(output_path, journal_record['source'], journal_record['offset'],
+                                   journal_record['stored_size'], journal_record['unpack_size'], journal_record['md5'])
+
+def parse_res_file(file_path, base_output_dir=None, options=None, file_data=None):
+    if file_data is None and not os.path.exists(file_path):
+        raise FileNotFoundError(f"File {file_path} not found")
 
-        # Process nested .res and .rtbl files
-        for nested_file in nested_res_files:
-            parse_res_file(nested_file, base_output_dir)
+    # The top level call owns the options (and their worker pool), nested calls just share them
+    if options is None:
+        options = ExtractOptions()
+        try:
+            parse_res_file(file_path, base_output_dir, options)
+        finally:
+            options.close()
+        return
 
-    except Exception as e:
-        print(f"Error processing {file_path}: {str(e)}")
+    output_dir = os.path.splitext(file_path)[0]
+    # Use base_output_dir from main .res file, or set it for the first call
+    if base_output_dir is None:
+        options.rdp_dir = os.path.dirname(os.path.abspath(file_path))
+        if options.resume:
+            options.journal = ExtractJournal(get_journal_path(file_path), output_dir)
+        try:
+            parse_res_file(file_path, output_dir, options)
+            if options.journal is not None:
+                options.journal.compact()
+        finally:
+            # Interrupted runs keep every line written so far, that's what the next --resume picks up from
+            if options.journal is not None:
+                options.journal.close()
+                options.journal = None
+        if options.manifest is not None:
+            write_manifest({
+                'version': MANIFEST_VERSION,
+                'archive': os.path.basename(file_path),
+                'entries': options.manifest,
+            }, get_manifest_path(file_path))
+        if options.dedup is not None:
+            write_dedup_report(options, output_dir, os.path.splitext(file_path)[0] + '.dedup.json')
+        return
+    
+    # This archive and everything nested in it, as tasks on the scheduler
+    NestedScheduler(options).run(file_path, base_output_dir, file_data)
 
 if __name__ == '__main__':
-    # Replace 'system.res' with whatever .res file you want to process
+    parser = argparse.ArgumentParser(description="Extracts a .res/.rtbl and everything nested inside it")
+    # Replace 'system.res' with whatever .res file you want to process (or just pass it in)
+    parser.add_argument('res_file', nargs='?', default='system.res')
+    parser.add_argument('-j', '--jobs', type=int,
+                        help="decompress/write on N workers (default: 1, --verify defaults to one per CPU)")
+    parser.add_argument('--processes', action='store_true', help="use a process pool instead of threads")
+    parser.add_argument('--manifest', action='store_true', help="also write <name>.manifest.json for incremental repacking")
+    parser.add_argument('--dedup', choices=('hardlink', 'reflink'),
+                        help="write identical files once and link the rest (reflink keeps the copies independent)")
+    parser.add_argument('--resume', action='store_true',
+                        help="keep <name>.journal.jsonl and skip entries it says are already extracted and unchanged")
+    parser.add_argument('--no-containers', action='store_true',
+                        help="don't write nested .res/.rtbl files, only the files inside them")
+    parser.add_argument('--plan', nargs='?', const='', metavar='PLAN_JSON',
+                        help="only work out what extracting would take (and save it as JSON if a path is given)")
+    parser.add_argument('--preflight', action='store_true',
+                        help="plan first and don't start if RDPs are missing or the output won't fit")
+    parser.add_argument('--verify', nargs='?', const='', metavar='REPORT_JSON',
+                        help="only check every entry decodes cleanly (and save a JSON report if a path is given)")
+    args = parser.parse_args()
+    options = ExtractOptions(args.jobs or 1, args.processes, args.manifest, args.dedup, args.resume, not args.no_containers)
     try:
-        parse_res_file('system.res')
+        if args.verify is not None:
+            verifier = ArchiveVerifier(args.res_file, args.jobs, args.processes).run()
+            verifier.print_summary()
+            if args.verify:
+                with open(args.verify, 'w', encoding='utf-8') as f:
+                    json.dump(verifier.report(), f, indent=2)
+            sys.exit(1 if verifier.bad or verifier.missing_rdps else 0)
+        if args.plan is not None or args.preflight:
+            plan = ExtractPlan(args.res_file, not args.no_containers).build()
+            plan.print_summary(args.jobs or 1)
+            if args.plan:
+                save_plan(plan, args.plan)
+            if args.plan is not None:
+                sys.exit(0)
+            if plan.missing_rdps:
+                raise FileNotFoundError(f"Missing {', '.join(sorted(plan.missing_rdps))}")
+            plan.check_space()
+        parse_res_file(args.res_file, options=options)
     except Exception as e:
-        print(f"Error: {e}")
\ No newline at end of file
+        # Nonzero so a script running --preflight knows nothing got extracted
+        print(f"Error: {e}")
+        sys.exit(1)
+    finally:
+        options.close()
@@ -0,0 +1,411 @@
+import io
+import os
+import sys
+import json
+import sqlite3
+import fnmatch
+import argparse
+import collections
+
+from ALPHA_EATER import (
+    RDP_FILES, RDP_POOL, STREAM_COPY_SIZE, ArchiveReader, ChunkRef, walk_archive_tree, read_fileset_chunk,
+    find_rdp_path, get_compression, get_decompressed_data, decompress_to_file
+)
+
+# Walks system.res (and every nested .res/.rtbl inside it) once and keeps every fileset in a
+# small SQLite catalog next to the .res file. Later runs just ask the catalog where something is
+# instead of re-parsing the whole tree again.
+
+CATALOG_VERSION = 2
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime_ns INTEGER
+);
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    virtual_path TEXT UNIQUE,
+    parent TEXT,
+    name TEXT,
+    type TEXT,
+    address_mode INTEGER,
+    rdp TEXT,
+    real_offset INTEGER,
+    size INTEGER,
+    unpack_size INTEGER,
+    compression TEXT,
+    depth INTEGER,
+    skip_reason TEXT
+);
+CREATE INDEX IF NOT EXISTS entries_parent ON entries (parent);
+'''
+
+
+def get_catalog_path(res_path):
+    # system.res -> system.catalog.db, right next to it
+    return os.path.splitext(os.path.abspath(res_path))[0] + '.catalog.db'
+
+def get_source_stats(res_path):
+    # size + mtime of the .res and every RDP it can reach, used to tell if the catalog went stale
+    res_path = os.path.abspath(res_path)
+    paths = [res_path]
+    for address_mode in RDP_FILES:
+        rdp_path = find_rdp_path(address_mode, os.path.dirname(res_path))
+        if rdp_path is not None:
+            paths.append(os.path.abspath(rdp_path))
+    stats = {}
+    for path in paths:
+        st = os.stat(path)
+        stats[path] = (st.st_size, st.st_mtime_ns)
+    return stats
+
+
+class CatalogBuilder:
+    # Collects one row per fileset, descending into nested archives straight from memory.
+    # probe_compression=False skips reading the first bytes of every entry to see how it's compressed
+    # (compression stays None), then only nested archives get read: the TOCs are all that's touched.
+    def __init__(self, res_path, probe_compression=True):
+        self.res_path = os.path.abspath(res_path)
+        self.base_dir = os.path.dirname(self.res_path)
+        self.probe_compression = probe_compression
+        self.rows = []
+
+    def _open_nested(self, entry, archive_data):
+        fileset = entry['fileset']
+        chunk_data = read_fileset_chunk(fileset, archive_data, fileset['size'], self.base_dir)
+        if chunk_data is None:
+            return None
+        try:
+            return get_decompressed_data(chunk_data, fileset['unpack_size'])
+        except Exception as e:
+            print(f"Warning: Could not index nested archive {entry['path']}: {e}")
+            return None
+
+    def walk(self, archive_path, archive_data, is_rtbl=False):
+        # Virtual paths are named by walk_archive_tree, the same way the extractor names its output
+        for entry in walk_archive_tree(archive_path, archive_data, is_rtbl, self._open_nested):
+            fileset = entry['fileset']
+            virtual_path = entry['path']
+            file_type = fileset['type']
+            skip_reason = entry['skip_reason']
+            if not virtual_path and not skip_reason:
+                skip_reason = "Invalid offset"
+
+            # Nested archives always get their header read, everything else only with probe_compression
+            compression = None
+            is_nested = file_type.lower() in ('res', 'rtbl')
+            if virtual_path and not entry['is_empty'] and (is_nested or self.probe_compression):
+                chunk_data = read_fileset_chunk(fileset, entry['archive_data'], 4, self.base_dir)
+                if chunk_data is not None:
+                    compression = get_compression(chunk_data)
+
+            self.rows.append((
+                virtual_path, entry['archive'], fileset['name'], file_type, fileset['address_mode'],
+                RDP_FILES.get(fileset['address_mode']), fileset['real_offset'], fileset['size'], fileset['unpack_size'],
+                compression, entry['depth'], skip_reason
+            ))
+
+
+def build_catalog(res_path, db_path=None):
+    # (Re)builds the catalog for res_path from scratch and returns its path
+    res_path = os.path.abspath(res_path)
+    db_path = db_path or get_catalog_path(res_path)
+    stats = get_source_stats(res_path)
+
+    builder = CatalogBuilder(res_path)
+    with ArchiveReader(res_path) as reader:
+        builder.walk(os.path.basename(res_path), reader.data, res_path.lower().endswith('.rtbl'))
+
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            conn.executescript(SCHEMA)
+            conn.execute('DELETE FROM meta')
+            conn.execute('DELETE FROM sources')
+            conn.execute('DELETE FROM entries')
+            conn.executemany('INSERT INTO meta VALUES (?, ?)', [
+                ('version', str(CATALOG_VERSION)), ('root', res_path)
+            ])
+            conn.executemany('INSERT INTO sources VALUES (?, ?, ?)', [
+                (path, size, mtime_ns) for path, (size, mtime_ns) in stats.items()
+            ])
+            conn.executemany(
+                'INSERT INTO entries (virtual_path, parent, name, type, address_mode, rdp, real_offset, size, '
+                'unpack_size, compression, depth, skip_reason) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                builder.rows
+            )
+    finally:
+        conn.close()
+    return db_path
+
+def walk_toc(res_path):
+    # Every fileset row of res_path and what's nested in it (same columns as the catalog's entries),
+    # read from the TOCs alone, no catalog involved. For list and stats.
+    res_path = os.path.abspath(res_path)
+    builder = CatalogBuilder(res_path, probe_compression=False)
+    with ArchiveReader(res_path) as reader:
+        builder.walk(os.path.basename(res_path), reader.data, res_path.lower().endswith('.rtbl'))
+    return builder.rows
+
+def get_toc_stats(rows):
+    # Counts and stored/unpacked byte totals, overall and per archive, type, address mode and RDP.
+    # Skipped filesets are counted on their own, they don't add to the sizes.
+    def new_group():
+        return {'entries': 0, 'skipped': 0, 'stored': 0, 'unpacked': 0}
+
+    totals = new_group()
+    groups = {dimension: collections.defaultdict(new_group) for dimension in ('archive', 'type', 'address_mode', 'rdp')}
+    for virtual_path, parent, _, file_type, address_mode, rdp, _, size, unpack_size, _, _, skip_reason in rows:
+        keys = {
+            'archive': parent,
+            'type': (file_type or '').lower() or '(none)',
+            'address_mode': f"{address_mode:#04x}",
+            'rdp': rdp or 'local',
+        }
+        for group in [totals] + [groups[dimension][key] for dimension, key in keys.items()]:
+            if virtual_path is None:
+                group['skipped'] += 1
+                continue
+            group['entries'] += 1
+            group['stored'] += size
+            group['unpacked'] += unpack_size
+    for group in [totals] + [group for dimension in groups.values() for group in dimension.values()]:
+        group['ratio'] = group['stored'] / group['unpacked'] if group['unpacked'] else None
+    return {'total': totals, **{dimension: dict(sorted(values.items())) for dimension, values in groups.items()}}
+
+def print_toc_stats(stats, out=sys.stdout):
+    def line(label, group):
+        ratio = f"{group['ratio']:.1%}" if group['ratio'] is not None else '-'
+        print(f"{label:<48} {group['entries']:>8} {group['skipped']:>8} {group['stored']:>14} "
+              f"{group['unpacked']:>14} {ratio:>7}", file=out)
+
+    print(f"{'':<48} {'entries':>8} {'skipped':>8} {'stored':>14} {'unpacked':>14} {'ratio':>7}", file=out)
+    line('total', stats['total'])
+    for dimension in ('archive', 'type', 'address_mode', 'rdp'):
+        print(f"by {dimension.replace('_', ' ')}:", file=out)
+        for key, group in stats[dimension].items():
+            line(f"  {key}", group)
+
+def catalog_is_current(conn, res_path):
+    # The catalog is only good while the .res and every RDP keep the size+mtime it was built from
+    try:
+        meta = dict(conn.execute('SELECT key, value FROM meta'))
+        stored = {path: (size, mtime_ns) for path, size, mtime_ns in conn.execute('SELECT path, size, mtime_ns FROM sources')}
+    except sqlite3.DatabaseError:
+        return False
+    if meta.get('version') != str(CATALOG_VERSION) or meta.get('root') != os.path.abspath(res_path):
+        return False
+    return stored == get_source_stats(res_path)
+
+def open_catalog(res_path, db_path=None, rebuild=True):
+    # Opens the catalog for res_path, rebuilding it first if it's missing or stale
+    db_path = db_path or get_catalog_path(res_path)
+    if os.path.exists(db_path):
+        conn = sqlite3.connect(db_path)
+        conn.row_factory = sqlite3.Row
+        if catalog_is_current(conn, res_path):
+            return conn
+        conn.close()
+    if not rebuild:
+        raise FileNotFoundError(f"No up to date catalog for {res_path}")
+    build_catalog(res_path, db_path)
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def update_catalog(res_path, moved=(), db_path=None):
+    # For RES_Packer, which knows exactly what it changed: moved = (virtual path, real_offset, size, unpack_size,
+    # compression) of every entry it rewrote. The .res and RDPs as they are now then count as what the catalog
+    # was built from, so it stays current without another walk. Only for a catalog that was current before.
+    db_path = db_path or get_catalog_path(res_path)
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            conn.executemany(
+                'UPDATE entries SET real_offset = ?2, size = ?3, unpack_size = ?4, compression = ?5 '
+                'WHERE virtual_path = ?1', moved
+            )
+            conn.execute('DELETE FROM sources')
+            conn.executemany('INSERT INTO sources VALUES (?, ?, ?)', [
+                (path, size, mtime_ns) for path, (size, mtime_ns) in get_source_stats(res_path).items()
+            ])
+    finally:
+        conn.close()
+
+def find_entries(conn, pattern='*'):
+    # Glob match on virtual paths, e.g. 'system.res/ui/*.gim'
+    return conn.execute(
+        'SELECT * FROM entries WHERE virtual_path GLOB ? ORDER BY id', (pattern,)
+    ).fetchall()
+
+
+class EntryIndex:
+    # virtual path -> (source, offset, size, unpack_size, codec), backed by the catalog's unique index.
+    # Lookups are memoized in a dict, so a build script pulling a few dozen assets only pays
+    # for one indexed query and one read per asset.
+    def __init__(self, res_path, db_path=None):
+        self.res_path = os.path.abspath(res_path)
+        self.base_dir = os.path.dirname(self.res_path)
+        self.conn = open_catalog(self.res_path, db_path)
+        self.locations = {}
+        self.archive_cache = {}  # decompressed nested archives, needed for their 0xC0/0xD0 entries
+
+    def lookup(self, virtual_path):
+        location = self.locations.get(virtual_path)
+        if location is None:
+            row = self.conn.execute(
+                'SELECT parent, address_mode, real_offset, size, unpack_size, compression FROM entries WHERE virtual_path = ?',
+                (virtual_path,)
+            ).fetchone()
+            if row is None:
+                raise FileNotFoundError(f"{virtual_path} not found in catalog")
+            if row['address_mode'] in RDP_FILES:
+                source = RDP_POOL.resolve(row['address_mode'], self.base_dir)
+                if source is None:
+                    raise FileNotFoundError(f"RDP file {RDP_FILES[row['address_mode']]} not found")
+            elif row['parent'] == os.path.basename(self.res_path):
+                source = self.res_path
+            else:
+                source = row['parent']  # a nested archive, read through the catalog again
+            location = (source, row['real_offset'], row['size'], row['unpack_size'], row['compression'])
+            self.locations[virtual_path] = location
+        return location
+
+    def read_raw(self, virtual_path):
+        # The stored (possibly compressed) bytes of an entry
+        source, offset, size, _, _ = self.lookup(virtual_path)
+        if offset is None or size == 0:
+            return b''
+        if os.path.isabs(source):
+            chunk_data = RDP_POOL.read(source, offset, size)
+        else:
+            if source not in self.archive_cache:
+                self.archive_cache[source] = self.read(source)
+            chunk_data = self.archive_cache[source][offset:offset + size]
+        if len(chunk_data) != size:
+            raise IOError(f"Could not read the complete chunk of {virtual_path}")
+        return chunk_data
+
+    def read(self, virtual_path):
+        # The decompressed bytes of an entry
+        return get_decompressed_data(self.read_raw(virtual_path), self.lookup(virtual_path)[3])
+
+    def stream(self, virtual_path, out, raw=False):
+        # Like read(), but writes to out a piece at a time instead of building the whole thing in memory.
+        # Entries straight out of a .res/.rdp never get loaded whole, nested ones already are.
+        source, offset, size, unpack_size, compression = self.lookup(virtual_path)
+        if offset is None or size == 0:
+            return 0
+        if not os.path.isabs(source):
+            data = self.read_raw(virtual_path) if raw else self.read(virtual_path)
+            out.write(data)
+            return len(data)
+        chunk = ChunkRef(source, offset, size)
+        if compression is not None and not raw:
+            return decompress_to_file(chunk.read, size, out, unpack_size)
+        pos = 0
+        while pos < size:
+            piece = chunk.read(pos, STREAM_COPY_SIZE)
+            if not piece:
+                raise IOError(f"Could not read the complete chunk of {virtual_path}")
+            out.write(piece)
+            pos += len(piece)
+        return pos
+
+    def close(self):
+        self.conn.close()
+        self.archive_cache.clear()
+
+
+_entry_indexes = {}
+
+def get_entry_index(res_path):
+    # One EntryIndex per .res file per process
+    res_path = os.path.abspath(res_path)
+    if res_path not in _entry_indexes:
+        _entry_indexes[res_path] = EntryIndex(res_path)
+    return _entry_indexes[res_path]
+
+def open_entry(virtual_path, base_dir='.'):
+    # open_entry("system.res/ui/foo.gim") -> file object with the decompressed data.
+    # The first part of the path is the .res file, looked up in base_dir.
+    res_name = virtual_path.split('/', 1)[0]
+    return io.BytesIO(get_entry_index(os.path.join(base_dir, res_name)).read(virtual_path))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SQLite catalog of every entry inside a .res tree")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    index_parser = subparsers.add_parser('index', help="build (or refresh) the catalog")
+    index_parser.add_argument('res_file')
+    index_parser.add_argument('--db', help="catalog path (default: next to the .res file)")
+    index_parser.add_argument('--force', action='store_true', help="rebuild even if the catalog is current")
+
+    find_parser = subparsers.add_parser('find', help="list catalog entries matching a glob")
+    find_parser.add_argument('res_file')
+    find_parser.add_argument('pattern', nargs='?', default='*')
+    find_parser.add_argument('--db', help="catalog path (default: next to the .res file)")
+
+    cat_parser = subparsers.add_parser('cat', help="write the decompressed data of entries to stdout")
+    cat_parser.add_argument('virtual_paths', nargs='+', help="e.g. system.res/ui/foo.gim")
+    cat_parser.add_argument('--base-dir', default='.', help="directory holding the .res file (default: current)")
+    cat_parser.add_argument('--raw', action='store_true', help="write the stored bytes without decompressing")
+
+    list_parser = subparsers.add_parser('list', help="list entries straight from the TOCs (no catalog, no payload reads)")
+    list_parser.add_argument('res_file')
+    list_parser.add_argument('pattern', nargs='?', default='*')
+
+    stats_parser = subparsers.add_parser('stats', help="entry counts, sizes and ratios straight from the TOCs")
+    stats_parser.add_argument('res_file')
+    stats_parser.add_argument('--json', action='store_true', help="print the stats as JSON")
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'index':
+        if args.force:
+            db_path = build_catalog(args.res_file, args.db)
+        else:
+            open_catalog(args.res_file, args.db).close()
+            db_path = args.db or get_catalog_path(args.res_file)
+        print(f"Catalog: {db_path}")
+    elif args.command == 'find':
+        conn = open_catalog(args.res_file, args.db)
+        try:
+            for row in find_entries(conn, args.pattern):
+                compression = row['compression'] or 'raw'
+                print(f"{row['virtual_path']}\t{row['address_mode']:#04x}\t{row['size']}\t{row['unpack_size']}\t{compression}")
+        finally:
+            conn.close()
+    elif args.command == 'list':
+        for row in walk_toc(args.res_file):
+            virtual_path = row[0]
+            if virtual_path is not None and fnmatch.fnmatchcase(virtual_path, args.pattern):
+                print(f"{virtual_path}\t{row[4]:#04x}\t{row[7]}\t{row[8]}")
+    elif args.command == 'stats':
+        stats = get_toc_stats(walk_toc(args.res_file))
+        if args.json:
+            json.dump(stats, sys.stdout, indent=1)
+            print()
+        else:
+            print_toc_stats(stats)
+    elif args.command == 'cat':
+        out = sys.stdout.buffer
+        for virtual_path in args.virtual_paths:
+            try:
+                index = get_entry_index(os.path.join(args.base_dir, virtual_path.split('/', 1)[0]))
+                index.stream(virtual_path, out, raw=args.raw)
+            except Exception as e:
+                print(f"Error: {e}", file=sys.stderr)
+                return 1
+        out.flush()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
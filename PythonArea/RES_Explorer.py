@@ -2,7 +2,6 @@ import sys
 import struct
 import os
 import zlib
-import io
 import hashlib
 import shutil
 import traceback
@@ -15,9 +14,11 @@ from PyQt5.QtWidgets import (
     QDialogButtonBox, QListWidget, QListWidgetItem, QAbstractItemView,
     QComboBox, QGroupBox, QCheckBox, QLabel
 )
-from PyQt5.QtCore import Qt, QByteArray, QThread, pyqtSignal
+from PyQt5.QtCore import Qt, QThread, pyqtSignal
 from PyQt5.QtGui import QFont, QFontMetrics, QPainter, QCursor, QColor, QKeySequence
 
+from ALPHA_EATER import decode_fileset_table, StringTable, FilesetEntry, ArchiveReader, RDP_POOL, RDP_FILES, inflate_blocks, assemble_blocks
+
 # --- HELPERS AND CONSTANTS ---
 
 MAGIC_HEADER = 0x73657250
@@ -89,7 +90,7 @@ class ResHeader:
     """Parses the header of a standard RES file."""
     def __init__(self, file_data):
         if len(file_data) < 32: raise ValueError("File data is too short for a valid header.")
-        header_struct = struct.unpack('<I I B I 3x I 12x', file_data[:32])
+        header_struct = struct.unpack_from('<I I B I 3x I 12x', file_data)
         self.magic, self.group_offset, self.group_count, self.unk1, self.configs_offset = header_struct
         if self.magic != MAGIC_HEADER: raise ValueError(f"Invalid magic header: expected {hex(MAGIC_HEADER)}, got {hex(self.magic)}")
 
@@ -97,7 +98,7 @@ class LocalizedResHeader:
     """Parses the header of a localized RES file."""
     def __init__(self, file_data):
         if len(file_data) < 32: raise ValueError("File data is too short for a localized header.")
-        header_struct = struct.unpack('<IIIII8xI', file_data[:32])
+        header_struct = struct.unpack_from('<IIIII8xI', file_data)
         self.magic, self.magic1, self.magic2, self.magic3, self.conf_length, self.country = header_struct
         if self.magic != MAGIC_HEADER:
             print(f"Warning: Magic header is non-standard: {hex(self.magic)}")
@@ -111,7 +112,7 @@ class ResDataSet:
             if offset + 8 > len(file_data):
                 print(f"Warning: Incomplete dataset entry at index {i}")
                 continue
-            dataset_offset, dataset_count = struct.unpack('<I I', file_data[offset:offset+8])
+            dataset_offset, dataset_count = struct.unpack_from('<I I', file_data, offset)
             self.datasets.append({'offset': dataset_offset, 'count': dataset_count})
 
 class ResFileSet:
@@ -119,58 +120,22 @@ class ResFileSet:
     def __init__(self, file_data, datasets, fileset_start=0x60):
         self.filesets = []
         total_fileset_count = sum(d['count'] for d in datasets)
-        for i in range(total_fileset_count):
-            offset = fileset_start + (i * 32)
-            if offset + 32 > len(file_data):
-                print(f"Warning: Incomplete fileset entry at index {i}")
-                continue
-            
-            fs_struct = struct.unpack('<I I I I 12x I', file_data[offset:offset+32])
-            raw_offset, size, offset_name, chunk_name, unpack_size = fs_struct
-            
-            address_mode = (raw_offset & 0xFF000000) >> 24
-            real_offset, skip_reason = None, None
-
-            if address_mode == 0x00: skip_reason = "Unknown address mode (0x00)"
-            elif address_mode == 0x30: skip_reason = "DataSet file (0x30)"
-            elif address_mode in (0xC0, 0xD0): real_offset = raw_offset & 0x00FFFFFF
-            elif address_mode in (0x40, 0x50, 0x60): real_offset = (raw_offset & 0x00FFFFFF) * 0x800
-            
-            if raw_offset == 0 and size == 0 and offset_name == 0 and chunk_name == 0 and unpack_size != 0:
-                skip_reason = "Dummy fileset"
-            
-            name_info = self._read_name_info(file_data, offset_name, chunk_name)
-            
-            self.filesets.append({
+        table = decode_fileset_table(file_data, fileset_start, total_fileset_count)
+        if table['count'] < total_fileset_count:
+            print(f"Warning: Incomplete fileset entries from index {table['count']} to {total_fileset_count - 1}")
+
+        columns = zip(
+            table['raw_offset'], table['real_offset'], table['size'], table['offset_name'],
+            table['chunk_name'], table['unpack_size'], table['address_mode'], table['skip_reason']
+        )
+        string_table = StringTable(file_data, encoding='utf-8', errors='ignore')
+        for raw_offset, real_offset, size, offset_name, chunk_name, unpack_size, address_mode, skip_reason in columns:
+            self.filesets.append(FilesetEntry(string_table, {
                 'raw_offset': raw_offset, 'real_offset': real_offset, 'size': size,
                 'unpack_size': unpack_size, 'address_mode': address_mode,
                 'offset_name': offset_name, 'chunk_name': chunk_name,
-                'name': name_info['name'], 'type': name_info['type'],
-                'directories': name_info['directories'], 'skip_reason': skip_reason,
-                'is_compressed': False
-            })
-
-    def _read_name_info(self, file_data, offset_name, chunk_name):
-        """Reads the name, type, and directory strings for a fileset entry."""
-        name_info = {'name': '', 'type': '', 'directories': []}
-        if offset_name == 0 or chunk_name == 0: return name_info
-        
-        pointers = []
-        for i in range(chunk_name):
-            pointer_offset = offset_name + (i * 4)
-            if pointer_offset + 4 > len(file_data): continue
-            pointers.append(struct.unpack('<I', file_data[pointer_offset:pointer_offset+4])[0])
-        
-        for i, pointer in enumerate(pointers):
-            if pointer == 0 or pointer >= len(file_data): continue
-            end_pos = file_data.find(b'\x00', pointer)
-            if end_pos == -1: end_pos = len(file_data)
-            string = file_data[pointer:end_pos].decode('utf-8', errors='ignore')
-            
-            if i == 0: name_info['name'] = string
-            elif i == 1: name_info['type'] = string
-            else: name_info['directories'].append(string)
-        return name_info
+                'skip_reason': skip_reason, 'is_compressed': False
+            }))
 
 # --- PARSING AND DECOMPRESSION UTILITIES ---
 
@@ -179,11 +144,11 @@ def parse_rtbl_data(file_data):
     filesets = []
     offset = 0
     while offset + 32 <= len(file_data):
-        if file_data[offset:offset+16] == b'\x00' * 16:
+        if struct.unpack_from('<QQ', file_data, offset) == (0, 0):
             offset += 16
             continue
         
-        fs_struct = struct.unpack('<I I I I 12x I', file_data[offset:offset+32])
+        fs_struct = struct.unpack_from('<I I I I 12x I', file_data, offset)
         raw_offset, size, offset_name, chunk_name, unpack_size = fs_struct
         
         if offset_name != 0x20:
@@ -221,69 +186,62 @@ def parse_rtbl_data(file_data):
         offset += 32
     return filesets
 
-def _decompress_blz2(chunk_data):
+def _inflate_raw_block(block):
+    """Inflates one raw deflate block of a BLZ2 stream."""
+    return zlib.decompressobj(wbits=-15).decompress(block)
+
+def _inflate_zlib_block(block):
+    """Inflates one BLZ4 block, falling back to raw deflate for headerless blocks."""
+    try:
+        return zlib.decompress(block)
+    except zlib.error as e:
+        try:
+            return zlib.decompress(block, wbits=-15)
+        except zlib.error: raise ValueError(f"Failed to decompress block: {e}")
+
+def _decompress_blz2(chunk_data, unpack_size=None):
     """Decompresses a BLZ2 compressed data chunk."""
-    decompressed_blocks = []
-    with io.BytesIO(chunk_data) as f:
-        if f.read(4) != BLZ2_HEADER: raise ValueError("Invalid BLZ2 header")
-        while True:
-            size_bytes = f.read(2)
-            if not size_bytes: break
-            compressed_size = struct.unpack('<H', size_bytes)[0]
-            if compressed_size == 0: continue
-            compressed_data = f.read(compressed_size)
-            if len(compressed_data) != compressed_size: raise ValueError("Incomplete compressed block")
-            decompressor = zlib.decompressobj(wbits=-15)
-            decompressed_blocks.append(decompressor.decompress(compressed_data))
-    if len(decompressed_blocks) > 1:
-        decompressed_blocks = decompressed_blocks[1:] + decompressed_blocks[:1]
-    return b''.join(decompressed_blocks)
+    if chunk_data[:4] != BLZ2_HEADER: raise ValueError("Invalid BLZ2 header")
+    view = memoryview(chunk_data)
+    blocks = []
+    pos = 4
+    while pos + 2 <= len(view):
+        compressed_size = struct.unpack_from('<H', view, pos)[0]
+        pos += 2
+        if compressed_size == 0: continue
+        if pos + compressed_size > len(view): raise ValueError("Incomplete compressed block")
+        blocks.append(view[pos:pos + compressed_size])
+        pos += compressed_size
+    # Blocks are independent, big entries get inflated across the shared block pool straight into their slots
+    return assemble_blocks(inflate_blocks(blocks, _inflate_raw_block), unpack_size, len(chunk_data))
 
 def _decompress_blz4(chunk_data):
     """Decompresses a BLZ4 compressed data chunk."""
-    with io.BytesIO(chunk_data) as f:
-        magic_header_bytes = f.read(4)
-        if magic_header_bytes != BLZ4_HEADER:
-            raise ValueError(f"Invalid BLZ4 magic number: {magic_header_bytes!r} != {BLZ4_HEADER!r}")
-        if len(chunk_data) < 32:
-            raise ValueError(f"Input data length {len(chunk_data)} is too short for BLZ4 format")
-
-        unpack_size = struct.unpack('<I', f.read(4))[0]
-        f.read(8)
-        md5 = f.read(16)
-        block_data = []
-        while True:
-            chunk_size_bytes = f.read(2)
-            if not chunk_size_bytes: break
-            if len(chunk_size_bytes) < 2: raise ValueError("Incomplete chunk size data at end of stream")
-            chunk_size = struct.unpack('<H', chunk_size_bytes)[0]
-            if chunk_size == 0:
-                final_block = f.read()
-                if final_block: block_data.append(final_block)
-                break
-            else:
-                block = f.read(chunk_size)
-                if len(block) < chunk_size: raise ValueError(f"Incomplete block: expected {chunk_size}, got {len(block)}")
-                block_data.append(block)
-        if not block_data: raise ValueError("No data blocks found in BLZ4 data")
-
-    if len(block_data) > 1:
-        real_list = block_data[1:] + block_data[:1]
-    else:
-        real_list = block_data
-
-    decompressed_blocks = []
-    for block in real_list:
-        try:
-            decompressed = zlib.decompress(block)
-            decompressed_blocks.append(decompressed)
-        except zlib.error as e:
-            try:
-                decompressed = zlib.decompress(block, wbits=-15)
-                decompressed_blocks.append(decompressed)
-            except zlib.error: raise ValueError(f"Failed to decompress block: {e}")
-
-    result = b''.join(decompressed_blocks)
+    magic_header_bytes = chunk_data[:4]
+    if magic_header_bytes != BLZ4_HEADER:
+        raise ValueError(f"Invalid BLZ4 magic number: {magic_header_bytes!r} != {BLZ4_HEADER!r}")
+    if len(chunk_data) < 32:
+        raise ValueError(f"Input data length {len(chunk_data)} is too short for BLZ4 format")
+
+    unpack_size = struct.unpack_from('<I', chunk_data, 4)[0]
+    md5 = chunk_data[16:32]
+    view = memoryview(chunk_data)
+    block_data = []
+    pos = 32
+    while pos < len(view):
+        if pos + 2 > len(view): raise ValueError("Incomplete chunk size data at end of stream")
+        chunk_size = struct.unpack_from('<H', view, pos)[0]
+        pos += 2
+        if chunk_size == 0:
+            if pos < len(view): block_data.append(view[pos:])
+            break
+        block = view[pos:pos + chunk_size]
+        if len(block) < chunk_size: raise ValueError(f"Incomplete block: expected {chunk_size}, got {len(block)}")
+        block_data.append(block)
+        pos += chunk_size
+    if not block_data: raise ValueError("No data blocks found in BLZ4 data")
+
+    result = assemble_blocks(inflate_blocks(block_data, _inflate_zlib_block), unpack_size, len(chunk_data))
     computed_md5 = hashlib.md5(result).digest()
     if computed_md5 != md5: print("Warning: BLZ4 MD5 checksum mismatch. Output may be corrupted.")
     if len(result) != unpack_size: print(f"Warning: BLZ4 unpack size mismatch. Expected {unpack_size}, got {len(result)}.")
@@ -293,29 +251,31 @@ def get_source_path(fileset, current_file_path):
     """Determines the source .rdp file based on the fileset's address mode."""
     address_mode = fileset['address_mode']
     if address_mode in (0x40, 0x50, 0x60):
-        rdp_map = {0x40: 'package.rdp', 0x50: 'data.rdp', 0x60: 'patch.rdp'}
-        rdp_file = rdp_map.get(address_mode)
-        rdp_path = os.path.join(os.path.dirname(current_file_path), rdp_file)
-        if not os.path.exists(rdp_path):
-            rdp_path = os.path.join(SCRIPT_DIR, rdp_file)
-        if not os.path.exists(rdp_path): raise FileNotFoundError(f"RDP file '{rdp_file}' not found.")
+        rdp_path = RDP_POOL.resolve(address_mode, os.path.dirname(current_file_path))
+        if rdp_path is None: raise FileNotFoundError(f"RDP file '{RDP_FILES[address_mode]}' not found.")
         return rdp_path
     return current_file_path
 
-def get_raw_file_chunk(fileset, current_file_path):
-    """Reads the raw (potentially compressed) data chunk for a fileset from disk."""
+def get_raw_file_chunk(fileset, current_file_path, archive_data=None):
+    """Reads the raw (potentially compressed) data chunk for a fileset, from archive_data if the archive is in memory."""
     real_offset, size = fileset['real_offset'], fileset['size']
     if real_offset is None or size == 0: return b''
     source_file = get_source_path(fileset, current_file_path)
-    with open(source_file, 'rb') as f:
-        f.seek(real_offset)
-        chunk_data = f.read(size)
-        if len(chunk_data) != size: raise IOError("Could not read the complete file chunk.")
-        return chunk_data
+    if source_file != current_file_path:
+        # RDPs are shared through the pool: one descriptor each, pread based, safe across threads
+        chunk_data = RDP_POOL.read(source_file, real_offset, size)
+    elif archive_data is not None:
+        chunk_data = bytes(archive_data[real_offset:real_offset + size])
+    else:
+        with open(source_file, 'rb') as f:
+            f.seek(real_offset)
+            chunk_data = f.read(size)
+    if len(chunk_data) != size: raise IOError("Could not read the complete file chunk.")
+    return chunk_data
 
-def get_decompressed_data(chunk_data):
+def get_decompressed_data(chunk_data, unpack_size=None):
     """Decompresses data if it has a known compression header, otherwise returns it as is."""
-    if chunk_data.startswith(BLZ2_HEADER): return _decompress_blz2(chunk_data)
+    if chunk_data.startswith(BLZ2_HEADER): return _decompress_blz2(chunk_data, unpack_size)
     if chunk_data.startswith(BLZ4_HEADER): return _decompress_blz4(chunk_data)
     return chunk_data
 
@@ -328,7 +288,7 @@ class HexEditor(QAbstractScrollArea):
         super().__init__(parent)
         self.setFocusPolicy(Qt.StrongFocus)
         self.setFont(QFont("Courier", 10))
-        self._data = QByteArray()
+        self._data = memoryview(b'')
         self.bytes_per_line = 16
         self.selection_start, self.selection_end = -1, -1
         self.drag_selection_start = -1
@@ -341,7 +301,8 @@ class HexEditor(QAbstractScrollArea):
         self.viewport().setCursor(Qt.IBeamCursor)
 
     def setData(self, data):
-        self._data = QByteArray(data)
+        # Any bytes-like object, kept as a memoryview so decoded entries are shown without a copy
+        self._data = memoryview(data)
         self.selection_start, self.selection_end = -1, -1
         self.drag_selection_start = -1
         self.verticalScrollBar().setRange(0, max(0, (len(self._data) - 1) // self.bytes_per_line))
@@ -362,7 +323,7 @@ class HexEditor(QAbstractScrollArea):
             for i in range(self.bytes_per_line):
                 byte_pos = address + i
                 if byte_pos >= len(self._data): break
-                byte_val = ord(self._data[byte_pos])
+                byte_val = self._data[byte_pos]
                 hex_x = self.address_width + i * 3 * self.char_width
                 ascii_x = self.address_width + self.hex_width + self.gap + i * self.char_width
                 if self.selection_start != -1 and self.selection_start <= byte_pos < self.selection_end:
@@ -374,7 +335,7 @@ class HexEditor(QAbstractScrollArea):
 
     def keyPressEvent(self, event):
         if event.matches(QKeySequence.Copy) and self.selection_start != -1 and self.selection_end > self.selection_start:
-            QApplication.clipboard().setText(self._data.mid(self.selection_start, self.selection_end - self.selection_start).toHex().data().decode())
+            QApplication.clipboard().setText(self._data[self.selection_start:self.selection_end].hex())
         else: super().keyPressEvent(event)
 
     def mousePressEvent(self, event):
@@ -482,13 +443,14 @@ class HeaderSelectionDialog(QDialog):
 
 class DataLoader(QThread):
     """Worker thread to decompress and load file data for the hex editor."""
-    dataLoaded = pyqtSignal(object, QByteArray)
+    dataLoaded = pyqtSignal(object, object)
     errorOccurred = pyqtSignal(str)
     
     def __init__(self):
         super().__init__()
         self.item_key = None
         self.temp_file_path = None
+        self.unpack_size = None
         
     def run(self):
         try:
@@ -496,8 +458,8 @@ class DataLoader(QThread):
                 raise FileNotFoundError("Pre-extracted file not found. Preloader may still be running.")
             with open(self.temp_file_path, 'rb') as f:
                 chunk_data = f.read()
-            decompressed_data = get_decompressed_data(chunk_data)
-            self.dataLoaded.emit(self.item_key, QByteArray(decompressed_data))
+            decompressed_data = get_decompressed_data(chunk_data, self.unpack_size)
+            self.dataLoaded.emit(self.item_key, decompressed_data)
         except Exception as e:
             traceback.print_exc()
             self.errorOccurred.emit(str(e))
@@ -507,10 +469,11 @@ class PreloaderThread(QThread):
     progressUpdated = pyqtSignal(int, int, str)
     preloadingComplete = pyqtSignal()
     
-    def __init__(self, files_to_preload, source_file_path, temp_session_dir, path_map):
+    def __init__(self, files_to_preload, source_file_path, temp_session_dir, path_map, source_data=None):
         super().__init__()
         self.files_to_preload = files_to_preload
         self.source_file_path = source_file_path
+        self.source_data = source_data
         self.temp_session_dir = temp_session_dir
         self.path_map = path_map
         self.is_running = True
@@ -525,7 +488,7 @@ class PreloaderThread(QThread):
             if fileset['skip_reason']: continue
             
             try:
-                raw_chunk = get_raw_file_chunk(fileset, self.source_file_path)
+                raw_chunk = get_raw_file_chunk(fileset, self.source_file_path, self.source_data)
                 if not raw_chunk: continue
                 
                 country_key = key if key != 'single' else '_root'
@@ -556,8 +519,10 @@ class MainWindow(QMainWindow):
         # Application state
         self.file_history = []
         self.current_file_path = None
+        self.current_file_data = None
         self.parsed_data = {}
         self.temp_path_map = collections.OrderedDict()
+        self.archive_reader = None
         self.root_header_type = None
         self.selected_languages = []
         
@@ -621,6 +586,7 @@ class MainWindow(QMainWindow):
         self.root_header_type = header_type
         self.selected_languages = selected_langs
         self.stop_preloader()
+        self.close_archive()
         self.temp_handler.clear_all()
         self.file_history.clear()
         self.load_file(path, header_type=header_type)
@@ -628,17 +594,26 @@ class MainWindow(QMainWindow):
     def load_file(self, path, is_nested=False, header_type='Original', nested_data=None, temp_level_name=None, is_going_back=False):
         """
         Loads and parses a file. Manages file history and temporary directories.
+        Nested files are parsed straight from nested_data; their path is only a name, nothing is written there.
         """
         try:
-            file_data = nested_data if nested_data is not None else open(path, 'rb').read()
+            # The previous file's filesets resolve names from its mapping, so stop using them first
+            self.stop_preloader()
+            self.close_archive()
+            if nested_data is not None:
+                file_data = nested_data
+            else:
+                self.archive_reader = ArchiveReader(path)
+                file_data = self.archive_reader.data
             
             if not is_going_back:
                 level_name = temp_level_name if temp_level_name else os.path.basename(path)
                 self.temp_handler.push_level(level_name)
-                # Store language selection in history
-                self.file_history.append((path, header_type, self.selected_languages))
+                # Store language selection in history (and a nested file's data, it only exists in memory)
+                self.file_history.append((path, header_type, self.selected_languages, nested_data))
 
             self.current_file_path = path
+            self.current_file_data = file_data
             self.update_ui(file_data, header_type)
             self.back_btn.setEnabled(len(self.file_history) > 1)
             self.start_preloader()
@@ -761,7 +736,7 @@ class MainWindow(QMainWindow):
             is_compressed_str = "N/A"
             if fs['real_offset'] is not None and fs['size'] > 4:
                 try:
-                    chunk_header = get_raw_file_chunk({'real_offset': fs['real_offset'], 'size': 4, 'address_mode': fs['address_mode']}, self.current_file_path)
+                    chunk_header = get_raw_file_chunk({'real_offset': fs['real_offset'], 'size': 4, 'address_mode': fs['address_mode']}, self.current_file_path, self.current_file_data)
                     if chunk_header.startswith(BLZ2_HEADER): is_compressed_str = "Yes (BLZ2)"
                     elif chunk_header.startswith(BLZ4_HEADER): is_compressed_str = "Yes (BLZ4)"
                     else: is_compressed_str = "No"
@@ -803,6 +778,7 @@ class MainWindow(QMainWindow):
             self.hex_editor.setData(b"Loading...")
             self.data_loader.item_key = item_key
             self.data_loader.temp_file_path = temp_path
+            self.data_loader.unpack_size = fileset['unpack_size']
             self.data_loader.start()
         else:
             self.hex_editor.setData(b"Awaiting preloader...")
@@ -816,16 +792,16 @@ class MainWindow(QMainWindow):
         file_type = fileset.get('type', '').lower()
         if file_type in ('res', 'rtbl'):
             try:
-                raw_chunk = get_raw_file_chunk(fileset, self.current_file_path)
-                nested_data = get_decompressed_data(raw_chunk)
+                raw_chunk = get_raw_file_chunk(fileset, self.current_file_path, self.current_file_data)
+                nested_data = get_decompressed_data(raw_chunk, fileset['unpack_size'])
                 if not nested_data:
                     QMessageBox.warning(self, "Empty File", f"Nested file '{fileset['name']}' is empty.")
                     return
                 
+                # Parsed from memory, the path is never written: it sits next to the parent so RDPs still resolve there
                 sanitized_name = "".join(c for c in fileset['name'] if c.isalnum() or c in (' ', '.', '_', '-')).rstrip()
                 temp_filename = f"__nested_{sanitized_name}_{index}.{file_type}"
-                temp_path = os.path.join(self.temp_handler.get_current_session_dir(), temp_filename)
-                with open(temp_path, 'wb') as f: f.write(nested_data)
+                nested_path = os.path.join(os.path.dirname(self.current_file_path), temp_filename)
                 
                 header_type = 'RTBL' if file_type == 'rtbl' else self.root_header_type
                 if not header_type:
@@ -833,7 +809,7 @@ class MainWindow(QMainWindow):
                     return
 
                 temp_level_name, _ = os.path.splitext(temp_filename)
-                self.load_file(temp_path, is_nested=True, header_type=header_type, nested_data=nested_data, temp_level_name=temp_level_name)
+                self.load_file(nested_path, is_nested=True, header_type=header_type, nested_data=nested_data, temp_level_name=temp_level_name)
             except Exception:
                 QMessageBox.critical(self, "Error", f"Could not open nested file:\n\n{traceback.format_exc()}")
 
@@ -852,14 +828,15 @@ class MainWindow(QMainWindow):
         """Navigates to the previously opened file."""
         if len(self.file_history) > 1:
             self.stop_preloader()
+            self.close_archive()
             self.temp_handler.pop_level_and_cleanup()
             self.file_history.pop()
             
             # Restore state from history, including language selection
-            path, header_type, self.selected_languages = self.file_history[-1]
+            path, header_type, self.selected_languages, nested_data = self.file_history[-1]
             
             try:
-                self.load_file(path, is_nested=len(self.file_history) > 1, header_type=header_type, is_going_back=True)
+                self.load_file(path, is_nested=len(self.file_history) > 1, header_type=header_type, nested_data=nested_data, is_going_back=True)
             except Exception as e:
                 QMessageBox.critical(self, "Navigation Error", f"Error going back to {path}:\n{e}")
         
@@ -895,8 +872,8 @@ class MainWindow(QMainWindow):
             
             try:
                 temp_path = self.temp_path_map.get(item_key)
-                raw_chunk = open(temp_path, 'rb').read() if temp_path and os.path.exists(temp_path) else get_raw_file_chunk(fileset, self.current_file_path)
-                final_data = get_decompressed_data(raw_chunk)
+                raw_chunk = open(temp_path, 'rb').read() if temp_path and os.path.exists(temp_path) else get_raw_file_chunk(fileset, self.current_file_path, self.current_file_data)
+                final_data = get_decompressed_data(raw_chunk, fileset['unpack_size'])
                 
                 rel_path = os.path.join(*fileset['directories']) if fileset['directories'] else ''
                 final_dir = os.path.join(output_dir, rel_path)
@@ -927,7 +904,7 @@ class MainWindow(QMainWindow):
         self.progress.setWindowModality(Qt.WindowModal)
         self.progress.canceled.connect(self.stop_preloader)
 
-        self.preloader_thread = PreloaderThread(files_to_preload, self.current_file_path, self.temp_handler.get_current_session_dir(), self.temp_path_map)
+        self.preloader_thread = PreloaderThread(files_to_preload, self.current_file_path, self.temp_handler.get_current_session_dir(), self.temp_path_map, self.current_file_data)
         self.preloader_thread.progressUpdated.connect(lambda i, total, name: (self.progress.setLabelText(f"({i+1}/{total}) Reading: {name}"), self.progress.setValue(i+1)))
         self.preloader_thread.preloadingComplete.connect(self.progress.close)
         self.preloader_thread.start()
@@ -939,9 +916,17 @@ class MainWindow(QMainWindow):
             self.preloader_thread.wait()
             self.preloader_thread = None
 
+    def close_archive(self):
+        """Releases the memory mapping of the currently opened file."""
+        self.current_file_data = None
+        if self.archive_reader is not None:
+            self.archive_reader.close()
+            self.archive_reader = None
+
     def closeEvent(self, event):
         """Handles the main window close event to clean up resources."""
         self.stop_preloader()
+        self.close_archive()
         self.temp_handler.clear_all()
         event.accept()
 
@@ -0,0 +1,584 @@
+import io
+import os
+import sys
+import shutil
+import sqlite3
+import struct
+import bisect
+import argparse
+import posixpath
+
+from ALPHA_EATER import (
+    RDP_FILES, RDP_POOL, ArchiveReader, read_archive_filesets, walk_archive_tree, find_rdp_path, get_compression,
+    get_decompressed_data, compress_blz2, compress_blz4, hash_file, read_manifest, write_manifest, get_manifest_path
+)
+from RES_Catalog import open_catalog, update_catalog
+
+# Puts modified files back into a .res/.rtbl (and its RDPs) without rebuilding anything.
+# The mod folder mirrors what ALPHA_EATER extracted (system.res -> system/...), nested
+# archives included (system/pack/nested/... goes back into pack/nested.res).
+# An entry that still fits its old 0x10 aligned slot is rewritten right where it was, only
+# entries that grew get moved to the end of their archive/RDP. Then just their 32 byte
+# TOC entries are patched, so a small edit only touches a few KB of the files.
+# Entries that move inside an RDP go into the best fitting hole left by earlier moves before
+# the RDP gets any bigger, see SectorAllocator.
+# With the manifest ALPHA_EATER --manifest writes, the whole extracted folder can be passed in:
+# only files whose content changed since (or since the last repack) get recompressed.
+# Names and RDP extents come from the RES_Catalog catalogs of the archive and its siblings while those
+# are current (and are kept current), the whole tree only gets walked for the ones that aren't.
+
+RES_ALIGN = 0x10
+RDP_SECTOR = 0x800
+# Offsets in the TOC are 24 bit (local ones in bytes, RDP ones in 0x800 sectors)
+OFFSET_LIMIT = 0x01000000
+
+def align(value, alignment):
+    return -(-value // alignment) * alignment
+
+def encode_like(data, compression, level):
+    # Compresses new data the same way the entry it replaces was
+    if compression == 'blz2':
+        try:
+            return compress_blz2(data, level)
+        except ValueError as e:
+            print(f"Warning: {e}, storing it uncompressed")
+            return data
+    if compression == 'blz4':
+        return compress_blz4(data, level)
+    return data
+
+def write_padded(stream, offset, data, alignment=RES_ALIGN):
+    # Writes data at offset and zero pads it to the next alignment boundary
+    stream.seek(offset)
+    stream.write(data)
+    padding = align(len(data), alignment) - len(data)
+    if padding:
+        stream.write(b'\x00' * padding)
+
+
+class SectorAllocator:
+    # Free space of one RDP, counted in 0x800 sectors. Built from every chunk the TOCs point to:
+    # chunks that overlap (aliases) count as one, and everything between them is a hole.
+    # (Nothing before the first chunk is ever handed out, in case an RDP keeps something there.)
+    # Holes are kept sorted by size for best fit, and by start/end so a freed chunk merges with
+    # the holes around it. Only when no hole is big enough does the file grow.
+    # append_only is for when not every archive using the RDP could be read: then nothing counts as
+    # free, every chunk might be someone else's too, and changed chunks all go to the end.
+    def __init__(self, extents, end_sector, append_only=False):
+        self.append_only = append_only
+        self.chunks = {}        # start sector -> [end sector, filesets pointing into it]
+        self.chunk_starts = []
+        self.holes = {}         # start sector -> length
+        self.hole_ends = {}     # end sector -> start sector
+        self.by_size = []       # (length, start) sorted, for best fit
+        self.end = end_sector
+
+        for start, end in sorted((offset // RDP_SECTOR, align(offset + size, RDP_SECTOR) // RDP_SECTOR) for offset, size in extents):
+            if self.chunk_starts and start < self.chunks[self.chunk_starts[-1]][0]:
+                chunk = self.chunks[self.chunk_starts[-1]]
+                chunk[0] = max(chunk[0], end)
+                chunk[1] += 1
+                continue
+            if self.chunk_starts and start > self.chunks[self.chunk_starts[-1]][0]:
+                self._add_hole(self.chunks[self.chunk_starts[-1]][0], start - self.chunks[self.chunk_starts[-1]][0])
+            self.chunks[start] = [end, 1]
+            self.chunk_starts.append(start)
+        if self.chunk_starts:
+            last_end = self.chunks[self.chunk_starts[-1]][0]
+            if last_end < self.end:
+                self._add_hole(last_end, self.end - last_end)
+            self.end = max(self.end, last_end)
+
+    def _add_hole(self, start, length):
+        self.holes[start] = length
+        self.hole_ends[start + length] = start
+        bisect.insort(self.by_size, (length, start))
+
+    def _remove_hole(self, start):
+        length = self.holes.pop(start)
+        del self.hole_ends[start + length]
+        del self.by_size[bisect.bisect_left(self.by_size, (length, start))]
+        return length
+
+    def _find_chunk(self, sector):
+        i = bisect.bisect_right(self.chunk_starts, sector) - 1
+        if i >= 0 and sector < self.chunks[self.chunk_starts[i]][0]:
+            return self.chunk_starts[i]
+        return None
+
+    def is_shared(self, sector):
+        if self.append_only:
+            return True
+        start = self._find_chunk(sector)
+        return start is None or self.chunks[start][1] > 1 or start != sector
+
+    def allocate(self, count):
+        # Best fit: the smallest hole that's big enough, otherwise the end of the file
+        i = bisect.bisect_left(self.by_size, (count, -1))
+        if self.append_only:
+            start = self.end
+            self.end += count
+        elif i < len(self.by_size):
+            length, start = self.by_size[i]
+            self._remove_hole(start)
+            if length > count:
+                self._add_hole(start + count, length - count)
+        else:
+            start = self.hole_ends.get(self.end, self.end) # a hole right at the end still gets used
+            if start != self.end:
+                self._remove_hole(start)
+            self.end = start + count
+        self.chunks[start] = [start + count, 1]
+        bisect.insort(self.chunk_starts, start)
+        return start
+
+    def grow(self, start, count):
+        # Lets a chunk nobody else uses grow in place when the sectors right behind it are free
+        end = self.chunks[start][0]
+        if start + count <= end:
+            return True
+        needed = start + count - end
+        length = self.holes.get(end, 0)
+        if length < needed and end + length != self.end:
+            return False
+        if length:
+            self._remove_hole(end)
+        if length > needed:
+            self._add_hole(end + needed, length - needed)
+        self.chunks[start][0] = start + count
+        self.end = max(self.end, start + count)
+        return True
+
+    def release(self, sector):
+        # One fileset less points at this chunk, once none do its sectors become a hole
+        start = self._find_chunk(sector)
+        if start is None or self.append_only:
+            return
+        chunk = self.chunks[start]
+        chunk[1] -= 1
+        if chunk[1] > 0:
+            return
+        end = chunk[0]
+        del self.chunks[start]
+        del self.chunk_starts[bisect.bisect_left(self.chunk_starts, start)]
+        if end in self.holes:
+            end += self._remove_hole(end)
+        if start in self.hole_ends:
+            start = self.hole_ends[start]
+            self._remove_hole(start)
+        self._add_hole(start, end - start)
+
+
+class RDPWriter:
+    # Opens the RDPs for writing the first time an entry in them changes.
+    # With an output directory the RDP gets copied there first (same as the old C# packer),
+    # otherwise it's changed in place.
+    # extents = {address_mode: [(offset, size), ...]} of every chunk in use, see scan_archive_tree.
+    def __init__(self, base_dir, output_dir=None, extents=None, append_only=False):
+        self.base_dir = base_dir
+        self.output_dir = output_dir
+        self.extents = extents if extents is not None else {}
+        self.append_only = append_only
+        self.files = {}
+        self.allocators = {}
+
+    def _open(self, address_mode):
+        f = self.files.get(address_mode)
+        if f is None:
+            source = find_rdp_path(address_mode, self.base_dir)
+            if source is None:
+                raise FileNotFoundError(f"RDP file {RDP_FILES[address_mode]} not found")
+            target = source
+            if self.output_dir is not None:
+                target = os.path.join(self.output_dir, RDP_FILES[address_mode])
+                if not os.path.exists(target):
+                    print(f"Copying {RDP_FILES[address_mode]} to {self.output_dir}")
+                    shutil.copyfile(source, target)
+            f = self.files[address_mode] = open(target, 'r+b')
+        return f
+
+    def read(self, address_mode, offset, size):
+        f = self.files.get(address_mode)
+        if f is None:
+            source = find_rdp_path(address_mode, self.base_dir)
+            if source is None:
+                raise FileNotFoundError(f"RDP file {RDP_FILES[address_mode]} not found")
+            return RDP_POOL.read(source, offset, size)
+        f.seek(offset)
+        return f.read(size)
+
+    def allocator(self, address_mode):
+        allocator = self.allocators.get(address_mode)
+        if allocator is None:
+            f = self._open(address_mode)
+            end_sector = align(f.seek(0, os.SEEK_END), RDP_SECTOR) // RDP_SECTOR
+            extents = self.extents.get(address_mode, ())
+            allocator = self.allocators[address_mode] = SectorAllocator(extents, end_sector, self.append_only)
+        return allocator
+
+    def write(self, address_mode, offset, data):
+        write_padded(self._open(address_mode), offset, data)
+
+    def rewrite(self, address_mode, offset, old_size, data):
+        # Writes a chunk that changed: in its own sectors if they (plus any free ones right behind them)
+        # are enough, otherwise into the best fitting hole, otherwise at the end. Gives back its offset.
+        allocator = self.allocator(address_mode)
+        count = max(1, align(len(data), RDP_SECTOR) // RDP_SECTOR)
+        start = offset // RDP_SECTOR
+        if allocator.is_shared(start) or not allocator.grow(start, count):
+            if old_size:
+                allocator.release(start)
+            start = allocator.allocate(count)
+        if start + count > OFFSET_LIMIT:
+            raise ValueError(f"{RDP_FILES[address_mode]} is full")
+        write_padded(self._open(address_mode), start * RDP_SECTOR, data, RDP_SECTOR)
+        return start * RDP_SECTOR
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files.clear()
+
+
+class ArchivePacker:
+    # Replaces entries of one .res/.rtbl. stream is the archive opened for writing: the file itself for
+    # the top level archive, a BytesIO for a nested one (which then goes back into its parent as a whole).
+    # names = {(archive virtual path, TOC index): (virtual path, output path)} for the whole tree, from
+    # scan_archive_tree, so every entry is matched by the exact name the extractor gave it.
+    def __init__(self, stream, archive_data, is_rtbl, rdps, level=9, archive='', names=None):
+        self.stream = stream
+        self.rdps = rdps
+        self.level = level
+        self.archive = archive  # this archive's virtual path (walk_archive_tree's naming)
+        self.names = names if names is not None else {}
+        self.written = []      # (relative path, entry) of everything write() put back
+        self.entries = []
+        self.paths = {}        # output path (relative to the top archive's folder) -> entry index
+        self.nested_dirs = {}  # folder a nested archive got extracted to -> entry index
+        self.replacements = {}
+        self.ref_counts = {}   # (address_mode, offset) -> how many filesets point there
+
+        for index, (fileset, skip_reason) in enumerate(read_archive_filesets(archive_data, is_rtbl)):
+            entry = {key: fileset[key] for key in (
+                'toc_offset', 'address_mode', 'real_offset', 'size', 'unpack_size', 'offset_name', 'chunk_name'
+            )}
+            file_type = fileset['type']
+            entry['virtual_path'], entry['path'] = self.names.get((archive, index), (None, None))
+            if entry['path'] is not None:
+                self.paths[entry['path']] = index
+                if file_type.lower() in ('res', 'rtbl'):
+                    entry['is_rtbl'] = file_type.lower() == 'rtbl'
+                    self.nested_dirs[posixpath.splitext(entry['path'])[0]] = index
+            if entry['real_offset'] is not None and entry['size']:
+                key = (entry['address_mode'], entry['real_offset'])
+                self.ref_counts[key] = self.ref_counts.get(key, 0) + 1
+            self.entries.append(entry)
+
+    def _read(self, entry, size):
+        if entry['address_mode'] in RDP_FILES:
+            return self.rdps.read(entry['address_mode'], entry['real_offset'], size)
+        self.stream.seek(entry['real_offset'])
+        return self.stream.read(size)
+
+    def add_files(self, files):
+        # files = {path relative to the top archive's output folder: file on disk}
+        # Gives back the paths that don't belong to any entry.
+        unmatched = []
+        nested_files = {}
+        for path, source in files.items():
+            if path in self.paths:
+                self.replacements[self.paths[path]] = source
+                continue
+            parts = path.split('/')
+            for cut in range(len(parts) - 1, 0, -1):
+                index = self.nested_dirs.get('/'.join(parts[:cut]))
+                if index is not None:
+                    nested_files.setdefault(index, {})[path] = source
+                    break
+            else:
+                unmatched.append(path)
+
+        for index, nested in nested_files.items():
+            if index in self.replacements:
+                print(f"Warning: {self.entries[index]['path']} was replaced as a whole, ignoring files inside it")
+                continue
+            entry = self.entries[index]
+            nested_data = bytearray(get_decompressed_data(self._read(entry, entry['size']), entry['unpack_size']))
+            packer = ArchivePacker(io.BytesIO(nested_data), nested_data, entry['is_rtbl'], self.rdps, self.level,
+                                   entry['virtual_path'], self.names)
+            unmatched += packer.add_files(nested)
+            if packer.replacements:
+                packer.write()
+                self.written += packer.written
+                self.replacements[index] = packer.stream.getvalue()
+        return unmatched
+
+    def write(self):
+        # Writes every replacement and patches its TOC entry
+        for index in sorted(self.replacements):
+            entry = self.entries[index]
+            data = self.replacements[index]
+            if isinstance(data, str):
+                with open(data, 'rb') as f:
+                    data = f.read()
+            if entry['real_offset'] is None:
+                print(f"Skipping: {entry['path']} (no usable offset in address mode {entry['address_mode']:#04x})")
+                continue
+
+            compression = get_compression(self._read(entry, 4)) if entry['size'] >= 4 else None
+            stored = encode_like(data, compression, self.level)
+            address_mode = entry['address_mode']
+            if address_mode in RDP_FILES:
+                shared = self.rdps.allocator(address_mode).is_shared(entry['real_offset'] // RDP_SECTOR)
+            else:
+                shared = self.ref_counts.get((address_mode, entry['real_offset']), 0) > 1
+
+            if len(stored) <= align(entry['size'], RES_ALIGN) and entry['size'] and not shared:
+                offset = entry['real_offset']
+                if address_mode in RDP_FILES:
+                    self.rdps.write(address_mode, offset, stored)
+                else:
+                    write_padded(self.stream, offset, stored)
+                print(f"Repacking: {entry['path']} (in place)")
+            else:
+                if address_mode in RDP_FILES:
+                    offset = self.rdps.rewrite(address_mode, entry['real_offset'], entry['size'], stored)
+                else:
+                    offset = align(self.stream.seek(0, os.SEEK_END), RES_ALIGN)
+                    if offset >= OFFSET_LIMIT:
+                        raise ValueError(f"No room left for {entry['path']} past the 24 bit offset limit")
+                    write_padded(self.stream, offset, stored)
+                if offset == entry['real_offset']:
+                    print(f"Repacking: {entry['path']} (grown in place)")
+                else:
+                    print(f"Repacking: {entry['path']} (moved to {offset:#010x})")
+
+            scale = RDP_SECTOR if address_mode in RDP_FILES else 1
+            raw_offset = (address_mode << 24) | (offset // scale)
+            self.stream.seek(entry['toc_offset'])
+            self.stream.write(struct.pack('<I I', raw_offset, len(stored)))
+            self.stream.seek(entry['toc_offset'] + 28)
+            self.stream.write(struct.pack('<I', len(data)))
+            entry.update(real_offset=offset, size=len(stored), unpack_size=len(data), compression=get_compression(stored))
+            self.written.append((entry['path'], entry))
+        self.replacements.clear()
+
+
+def scan_archive_tree(archive_name, archive_data, is_rtbl, rdps, extents=None):
+    # One walk over this archive and every archive nested in it. Gives back
+    # {address_mode: [(offset, size), ...]} for every RDP chunk the tree points to (what the RDP
+    # allocators treat as taken) and the names the extractor gave every entry, see ArchivePacker.
+    if extents is None:
+        extents = {}
+    names = {}
+
+    def open_nested(entry, data):
+        fileset = entry['fileset']
+        if fileset['address_mode'] in RDP_FILES:
+            chunk_data = rdps.read(fileset['address_mode'], fileset['real_offset'], fileset['size'])
+        else:
+            chunk_data = data[fileset['real_offset']:fileset['real_offset'] + fileset['size']]
+        return get_decompressed_data(chunk_data, fileset['unpack_size'])
+
+    for entry in walk_archive_tree(archive_name, archive_data, is_rtbl, open_nested):
+        fileset = entry['fileset']
+        if entry['path'] is not None:
+            names[(entry['archive'], entry['index'])] = (entry['path'], entry['output_path'])
+        if entry['skip_reason'] or fileset['real_offset'] is None or fileset['size'] == 0:
+            continue
+        if fileset['address_mode'] in RDP_FILES:
+            extents.setdefault(fileset['address_mode'], []).append((fileset['real_offset'], fileset['size']))
+    return extents, names
+
+def load_catalog_tree(archive_path, extents=None):
+    # Same as scan_archive_tree, out of archive_path's RES_Catalog catalog: no nested archive gets
+    # decompressed. None when there's no catalog or it's stale (the .res or an RDP changed since).
+    # The catalog has one row per fileset in walk order, so an entry's TOC index is its place among
+    # its archive's rows, and its output path is its virtual path moved under that archive's folder.
+    try:
+        conn = open_catalog(archive_path, rebuild=False)
+    except (FileNotFoundError, sqlite3.DatabaseError):
+        return None
+    found = {}
+    names = {}
+    counts = {}
+    folders = {os.path.basename(os.path.abspath(archive_path)): ''}  # archive virtual path -> its output folder
+    try:
+        for row in conn.execute('SELECT virtual_path, parent, type, address_mode, real_offset, size, skip_reason '
+                                'FROM entries ORDER BY id'):
+            parent = row['parent']
+            index = counts.get(parent, 0)
+            counts[parent] = index + 1
+            virtual_path = row['virtual_path']
+            if virtual_path is not None:
+                output_path = posixpath.join(folders[parent], virtual_path[len(parent) + 1:])
+                names[(parent, index)] = (virtual_path, output_path)
+                if row['type'].lower() in ('res', 'rtbl'):
+                    folders[virtual_path] = posixpath.splitext(output_path)[0]
+            if row['skip_reason'] or row['real_offset'] is None or row['size'] == 0:
+                continue
+            if row['address_mode'] in RDP_FILES:
+                found.setdefault(row['address_mode'], []).append((row['real_offset'], row['size']))
+    finally:
+        conn.close()
+    if extents is None:
+        extents = {}
+    for address_mode, chunks in found.items():
+        extents.setdefault(address_mode, []).extend(chunks)
+    return extents, names
+
+def filter_changed_files(files, manifest):
+    # Drops every file that's still what the manifest says was extracted (or last packed).
+    # Same size and mtime counts as unchanged right away, otherwise the MD5 decides; files that were
+    # only touched get their new mtime noted so they're not hashed again next time.
+    entries = manifest['entries']
+    changed = {}
+    for path, source in files.items():
+        record = entries.get(path)
+        if record is None:
+            changed[path] = source
+            continue
+        stat = os.stat(source)
+        if stat.st_size == record['size'] and stat.st_mtime_ns == record['mtime_ns']:
+            continue
+        if stat.st_size == record['size'] and hash_file(source) == record['md5']:
+            record['mtime_ns'] = stat.st_mtime_ns
+            continue
+        changed[path] = source
+    return changed
+
+def update_manifest(manifest, files, written):
+    # Points the manifest at what was just packed: new content for the files that went in,
+    # new locations for them and for nested archives that had to move because of them
+    entries = manifest['entries']
+    for path, entry in written:
+        record = entries.setdefault(path, {})
+        record.update(offset=entry['real_offset'], stored_size=entry['size'], unpack_size=entry['unpack_size'])
+        if path in files:
+            stat = os.stat(files[path])
+            record.update(md5=hash_file(files[path]), size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+
+def collect_mod_files(mod_dir):
+    # every file under mod_dir, keyed by its path relative to it (with / separators)
+    files = {}
+    for root, dirs, filenames in os.walk(mod_dir):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            files[os.path.relpath(path, mod_dir).replace(os.sep, '/')] = path
+    return files
+
+def find_rdp_users(archive_path, base_dir):
+    # Every other .res/.rtbl next to the RDPs archive_path uses (system_update.res, the other language
+    # archives...). Their chunks live in the same RDPs, so they count as taken too.
+    directories = set()
+    for address_mode in RDP_FILES:
+        rdp_path = find_rdp_path(address_mode, base_dir)
+        if rdp_path is not None:
+            directories.add(os.path.dirname(os.path.abspath(rdp_path)))
+    users = []
+    for directory in sorted(directories):
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if os.path.splitext(name)[1].lower() in ('.res', '.rtbl') and os.path.isfile(path) \
+                    and not os.path.samefile(path, archive_path):
+                users.append(path)
+    return users
+
+def repack_archive(archive_path, files, output_dir=None, level=9, rdp_users=(), manifest_path=None, append_only=False):
+    # Puts files ({relative path: file on disk}) back into archive_path.
+    # With output_dir the archive (and any RDP that changes) is copied there first and only the copy is touched.
+    # Every other archive next to the RDPs is read too (find_rdp_users), plus rdp_users from anywhere else,
+    # and their chunks are kept clear of. If one of them can't be read, or with append_only, the RDPs
+    # only ever grow: changed chunks go to the end instead of into holes or their old sectors.
+    # With manifest_path only files that changed since are packed, and the manifest gets updated
+    # (written next to the output archive when there's an output_dir).
+    # Catalogs that were current (see load_catalog_tree) get what moved, so they still are afterwards.
+    # Returns the paths that didn't match any entry.
+    manifest = None
+    if manifest_path is not None:
+        manifest = read_manifest(manifest_path)
+        files = filter_changed_files(files, manifest)
+        print(f"{len(files)} changed file(s) to pack")
+    base_dir = os.path.dirname(os.path.abspath(archive_path))
+    target_path = archive_path
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+        target_path = os.path.join(output_dir, os.path.basename(archive_path))
+        shutil.copyfile(archive_path, target_path)
+
+    is_rtbl = archive_path.lower().endswith('.rtbl')
+    rdp_users = list(rdp_users)
+    rdp_users += [path for path in find_rdp_users(archive_path, base_dir)
+                  if not any(os.path.samefile(path, user) for user in rdp_users)
+                  and not (os.path.exists(target_path) and os.path.samefile(path, target_path))]
+    rdps = RDPWriter(base_dir, output_dir, append_only=append_only)
+    cataloged = []  # archives whose catalog gave the names and extents
+    try:
+        with open(target_path, 'r+b') as stream:
+            # Only the TOC is parsed from the mapping, it's closed again before anything gets written
+            with ArchiveReader(target_path) as reader:
+                archive_name = os.path.basename(target_path)
+                tree = load_catalog_tree(archive_path, rdps.extents)
+                if tree is None:
+                    tree = scan_archive_tree(archive_name, reader.data, is_rtbl, rdps, rdps.extents)
+                else:
+                    cataloged.append(archive_path)
+                packer = ArchivePacker(stream, reader.data, is_rtbl, rdps, level, archive_name, tree[1])
+            for other_path in rdp_users:
+                if load_catalog_tree(other_path, rdps.extents) is not None:
+                    cataloged.append(other_path)
+                    continue
+                try:
+                    with ArchiveReader(other_path) as reader:
+                        scan_archive_tree(os.path.basename(other_path), reader.data, other_path.lower().endswith('.rtbl'),
+                                          rdps, rdps.extents)
+                except Exception as e:
+                    print(f"Warning: Could not read {other_path} ({e}), RDP space it uses is unknown: appending only")
+                    rdps.append_only = True
+            unmatched = packer.add_files(files)
+            packer.write()
+    finally:
+        rdps.close()
+    if output_dir is None:
+        # Other archives' TOCs weren't touched, their catalogs just need the new RDP sizes and mtimes
+        for path in cataloged:
+            moved = [(entry['virtual_path'], entry['real_offset'], entry['size'], entry['unpack_size'], entry['compression'])
+                     for _, entry in packer.written] if path == archive_path else ()
+            update_catalog(path, moved)
+    if manifest is not None:
+        update_manifest(manifest, files, packer.written)
+        write_manifest(manifest, get_manifest_path(target_path))
+    return unmatched
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Puts modified files back into a .res/.rtbl and its RDPs")
+    parser.add_argument('res_file')
+    parser.add_argument('mod_dir', help="folder laid out like the extracted archive (e.g. system/)")
+    parser.add_argument('-o', '--output', help="write to copies in this folder instead of changing the originals")
+    parser.add_argument('--level', type=int, default=9, help="zlib level for recompressed entries (default: 9)")
+    parser.add_argument('--manifest', help="manifest from ALPHA_EATER --manifest (default: <name>.manifest.json if it exists)")
+    parser.add_argument('--full', action='store_true', help="ignore the manifest and pack every file in mod_dir")
+    parser.add_argument('--rdp-users', nargs='+', default=[], metavar='ARCHIVE',
+                        help="archives elsewhere using the same RDPs, so their data isn't overwritten "
+                             "(the ones next to the RDPs are always found)")
+    parser.add_argument('--append-only', action='store_true',
+                        help="never reuse RDP space, changed chunks always go to the end")
+    args = parser.parse_args()
+    if not os.path.isdir(args.mod_dir):
+        print(f"Error: {args.mod_dir} is not a folder")
+        sys.exit(1)
+
+    try:
+        manifest_path = args.manifest
+        if manifest_path is None and os.path.exists(get_manifest_path(args.res_file)):
+            manifest_path = get_manifest_path(args.res_file)
+        if args.full:
+            manifest_path = None
+        unmatched = repack_archive(args.res_file, collect_mod_files(args.mod_dir), args.output, args.level,
+                                   args.rdp_users, manifest_path, args.append_only)
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    for path in unmatched:
+        print(f"Warning: {path} doesn't match any entry, skipped")
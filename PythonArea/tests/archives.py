@@ -0,0 +1,75 @@
+import os
+import struct
+
+from ALPHA_EATER import MAGIC_HEADER, RDP_FILES, FILESET_STRUCT, compress_blz2, compress_blz4
+
+# Builds small .res trees for the tests: a header, one dataset with every fileset in it, the name
+# pointers and strings, then the 0xC0 chunks. RDP chunks go into the rdps dict, 0x800 aligned.
+
+
+def payload(size, seed=0):
+    # Compressible, but every block different
+    out = bytearray()
+    while len(out) < size:
+        out += f'{seed}:{len(out)} GOD EATER '.encode()
+    return bytes(out[:size])
+
+
+def stored(data, compression=None):
+    if compression == 'blz2':
+        return compress_blz2(data)
+    if compression == 'blz4':
+        return compress_blz4(data)
+    return data
+
+
+def build_res(entries, rdps):
+    # entries: (name, type, [directories], address_mode, stored bytes, unpack_size)
+    table_end = 0x60 + len(entries) * 32
+    pointers = bytearray()
+    strings = bytearray()
+    string_offsets = {}
+    pointer_size = sum(4 * (2 + len(entry[2])) for entry in entries)
+
+    def string(text):
+        if text not in string_offsets:
+            string_offsets[text] = table_end + pointer_size + len(strings)
+            strings.extend(text.encode() + b'\x00')
+        return string_offsets[text]
+
+    name_offsets = []
+    for name, file_type, directories, *_ in entries:
+        name_offsets.append(table_end + len(pointers))
+        for text in (name, file_type, *directories):
+            pointers.extend(struct.pack('<I', string(text)))
+    body = pointers + strings
+    body += b'\x00' * (-(table_end + len(body)) % 16)
+
+    local = bytearray()
+    local_start = table_end + len(body)
+    table = bytearray()
+    for (name, file_type, directories, address_mode, data, unpack_size), offset_name in zip(entries, name_offsets):
+        if address_mode in (0xC0, 0xD0):
+            raw_offset = (address_mode << 24) | (local_start + len(local))
+            local += data + b'\x00' * (-len(data) % 16)
+        else:
+            rdp = rdps.setdefault(address_mode, bytearray())
+            raw_offset = (address_mode << 24) | (len(rdp) // 0x800)
+            rdp += data + b'\x00' * (-len(data) % 0x800)
+        table += FILESET_STRUCT.pack(raw_offset, len(data), offset_name, 2 + len(directories), unpack_size)
+
+    header = struct.pack('<I I B I 3x I 12x', MAGIC_HEADER, 0x20, 8, 0, 0)
+    datasets = struct.pack('<II', 0x60, len(entries)) + bytes(56)
+    return bytes(header + datasets + table + body + local)
+
+
+def write_tree(directory, entries, name='system.res'):
+    # Writes system.res and its RDPs into directory, gives back the .res path
+    rdps = {}
+    res_path = os.path.join(directory, name)
+    with open(res_path, 'wb') as f:
+        f.write(build_res(entries, rdps))
+    for address_mode, data in rdps.items():
+        with open(os.path.join(directory, RDP_FILES[address_mode]), 'wb') as f:
+            f.write(data)
+    return res_path
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The scripts aren't a package, tests import them straight out of PythonArea
+PYTHON_AREA = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PYTHON_AREA)
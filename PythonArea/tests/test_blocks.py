@@ -0,0 +1,23 @@
+from ALPHA_EATER import assemble_blocks, compress_blz2, compress_blz4, get_decompressed_data
+
+DATA = bytes(range(256)) * 1000
+
+
+def test_assemble_blocks_puts_the_first_block_last():
+    assert assemble_blocks([b'C', b'A', b'B'], 3) == b'ABC'
+    assert assemble_blocks([b'C', b'A', b'B']) == b'ABC'
+
+
+def test_assemble_blocks_fixes_up_a_wrong_unpack_size():
+    assert assemble_blocks([b'CC', b'AA', b'BB'], 4) == b'AABBCC'
+    assert assemble_blocks([b'CC', b'AA', b'BB'], 9) == b'AABBCC'
+
+
+def test_broken_unpack_size_isnt_allocated():
+    # 1 TB would be a MemoryError if it was trusted
+    assert get_decompressed_data(compress_blz2(DATA), 1 << 40) == DATA
+    assert assemble_blocks([b'C', b'A', b'B'], 1 << 40, stored_size=3) == b'ABC'
+
+
+def test_blz4_round_trip():
+    assert get_decompressed_data(compress_blz4(DATA)) == DATA
@@ -0,0 +1,46 @@
+import os
+import subprocess
+import sys
+
+from archives import payload, stored, write_tree
+from conftest import PYTHON_AREA
+
+B1 = payload(300000, 1)
+B2 = payload(500000, 2)
+
+
+def make_tree(tmp_path):
+    write_tree(str(tmp_path), [
+        ('b1', 'bin', [], 0x40, stored(B1, 'blz2'), len(B1)),
+        ('b2', 'bin', [], 0x50, stored(B2, 'blz4'), len(B2)),
+    ])
+
+
+def cat(tmp_path, out, *virtual_paths):
+    subprocess.run([sys.executable, os.path.join(PYTHON_AREA, 'RES_Catalog.py'), 'cat', *virtual_paths],
+                   cwd=str(tmp_path), stdout=out, check=True)
+
+
+def test_cat_two_entries_into_one_file(tmp_path):
+    make_tree(tmp_path)
+    with open(tmp_path / 'two.bin', 'wb') as out:
+        cat(tmp_path, out, 'system.res/b1.bin', 'system.res/b2.bin')
+    assert (tmp_path / 'two.bin').read_bytes() == B1 + B2
+
+
+def test_cat_appends_in_order(tmp_path):
+    make_tree(tmp_path)
+    (tmp_path / 'app.bin').write_bytes(b'head')
+    with open(tmp_path / 'app.bin', 'ab') as out:
+        cat(tmp_path, out, 'system.res/b1.bin')
+    with open(tmp_path / 'app.bin', 'ab') as out:
+        cat(tmp_path, out, 'system.res/b2.bin')
+    assert (tmp_path / 'app.bin').read_bytes() == b'head' + B1 + B2
+
+
+def test_cat_into_a_pipe(tmp_path):
+    make_tree(tmp_path)
+    result = subprocess.run([sys.executable, os.path.join(PYTHON_AREA, 'RES_Catalog.py'), 'cat',
+                             'system.res/b2.bin', 'system.res/b1.bin'],
+                            cwd=str(tmp_path), stdout=subprocess.PIPE, check=True)
+    assert result.stdout == B2 + B1
@@ -0,0 +1,62 @@
+import os
+import sqlite3
+
+import RES_Packer
+from ALPHA_EATER import parse_res_file
+from RES_Catalog import build_catalog, catalog_is_current, get_catalog_path
+from archives import build_res, payload, stored, write_tree
+
+INNER = build_res([(f'in{i}', 'bin', ['inner'], 0xC0, stored(payload(3000 + i, i), 'blz2'), 3000 + i)
+                   for i in range(4)], {})
+
+
+def make_tree(directory):
+    return write_tree(directory, [
+        ('a', 'bin', ['ui'], 0x40, stored(payload(9000, 1), 'blz2'), 9000),
+        ('b', 'bin', ['ui'], 0x50, stored(payload(7000, 2), 'blz4'), 7000),
+        ('nested', 'res', ['pack'], 0x40, stored(INNER, 'blz2'), len(INNER)),
+    ])
+
+
+def repack(res_path, monkeypatch):
+    # Grows a file inside the nested archive, gives back the archives that had to be walked
+    walked = []
+    scan = RES_Packer.scan_archive_tree
+    monkeypatch.setattr(RES_Packer, 'scan_archive_tree', lambda name, *args: walked.append(name) or scan(name, *args))
+    mod = os.path.join(os.path.dirname(res_path), 'mod')
+    os.makedirs(os.path.join(mod, 'pack', 'nested', 'inner'))
+    with open(os.path.join(mod, 'pack', 'nested', 'inner', 'in2.bin'), 'wb') as f:
+        f.write(payload(12000, 9))
+    assert RES_Packer.repack_archive(res_path, RES_Packer.collect_mod_files(mod)) == []
+    return walked
+
+
+def test_repack_takes_names_from_a_current_catalog(tmp_path, monkeypatch):
+    res_path = make_tree(str(tmp_path))
+    build_catalog(res_path)
+    assert repack(res_path, monkeypatch) == []
+
+    conn = sqlite3.connect(get_catalog_path(res_path))
+    try:
+        assert catalog_is_current(conn, res_path)
+        kept = conn.execute('SELECT * FROM entries ORDER BY id').fetchall()
+    finally:
+        conn.close()
+    fresh = build_catalog(res_path, str(tmp_path / 'fresh.db'))
+    conn = sqlite3.connect(fresh)
+    try:
+        assert conn.execute('SELECT * FROM entries ORDER BY id').fetchall() == kept
+    finally:
+        conn.close()
+
+    parse_res_file(res_path)
+    with open(tmp_path / 'system' / 'pack' / 'nested' / 'inner' / 'in2.bin', 'rb') as f:
+        assert f.read() == payload(12000, 9)
+
+
+def test_repack_walks_the_tree_when_the_catalog_is_stale(tmp_path, monkeypatch):
+    res_path = make_tree(str(tmp_path))
+    build_catalog(res_path)
+    with open(tmp_path / 'package.rdp', 'ab') as f:
+        f.write(b'\x00' * 0x800)
+    assert repack(res_path, monkeypatch) == ['system.res']
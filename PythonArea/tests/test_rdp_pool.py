@@ -0,0 +1,9 @@
+from ALPHA_EATER import RDPPool
+
+
+def test_missing_rdp_is_looked_for_again(tmp_path):
+    pool = RDPPool()
+    assert pool.resolve(0x40, str(tmp_path)) is None
+    (tmp_path / 'package.rdp').write_bytes(b'\x00' * 0x800)
+    assert pool.resolve(0x40, str(tmp_path)) == str(tmp_path / 'package.rdp')
+    pool.close()
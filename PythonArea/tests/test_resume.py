@@ -0,0 +1,93 @@
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from archives import build_res, payload, stored, write_tree
+from conftest import PYTHON_AREA
+
+# Stands in for a crash: the Nth chunk gets half written and the process dies on the spot,
+# no journal flush, no cleanup
+CRASH = '''
+import os, sys
+sys.path.insert(0, {python_area!r})
+import ALPHA_EATER
+write_chunk = ALPHA_EATER.write_chunk
+calls = [0]
+def crashing_write_chunk(job, chunk_data, *args):
+    calls[0] += 1
+    if calls[0] == {crash_at}:
+        with open(job[1], 'wb') as f:
+            f.write(bytes(chunk_data[:len(chunk_data) // 2]))
+        os._exit(1)
+    return write_chunk(job, chunk_data, *args)
+ALPHA_EATER.write_chunk = crashing_write_chunk
+ALPHA_EATER.parse_res_file('system.res', options=ALPHA_EATER.ExtractOptions(resume=True))
+'''
+
+
+def make_tree(directory):
+    inner = build_res([(f'in{i}', 'bin', ['inner'], 0xC0, stored(payload(3000 + i, i), 'blz2'), 3000 + i)
+                       for i in range(6)], {})
+    entries = []
+    for i in range(30):
+        data = payload(20000 + 997 * i, i)
+        compression = (None, 'blz2', 'blz4')[i % 3]
+        entries.append((f'file{i}', 'dat', ['ui', f'dir{i % 3}'], (0x40, 0x50, 0xC0)[i % 3],
+                        stored(data, compression), len(data)))
+        if i % 10 == 0:
+            entries.append(('dup', 'gim', ['ui'], 0x40, stored(payload(5000, i), 'blz2'), 5000))
+    # The same archive twice, the second one gets the first one's tree copied over
+    entries.append(('nested', 'res', ['pack'], 0x50, stored(inner, 'blz4'), len(inner)))
+    entries.append(('again', 'res', ['pack'], 0x40, stored(inner, 'blz2'), len(inner)))
+    write_tree(directory, entries)
+
+
+def extract(directory, *args):
+    result = subprocess.run([sys.executable, os.path.join(PYTHON_AREA, 'ALPHA_EATER.py'), 'system.res', *args],
+                            cwd=directory, stdout=subprocess.PIPE, universal_newlines=True, check=True)
+    return result.stdout
+
+
+def output_tree(directory):
+    tree = {}
+    root = os.path.join(directory, 'system')
+    for folder, _, files in os.walk(root):
+        for name in files:
+            path = os.path.join(folder, name)
+            with open(path, 'rb') as f:
+                tree[os.path.relpath(path, root).replace(os.sep, '/')] = f.read()
+    return tree
+
+
+# 35 chunks in the top archive, then the nested one's
+@pytest.mark.parametrize('crash_at', [1, 15, 38])
+def test_resume_after_a_crash_matches_a_clean_extraction(tmp_path, crash_at):
+    clean = str(tmp_path / 'clean')
+    crashed = str(tmp_path / 'crashed')
+    os.makedirs(clean)
+    make_tree(clean)
+    shutil.copytree(clean, crashed)
+    extract(clean)
+
+    script = CRASH.format(python_area=PYTHON_AREA, crash_at=crash_at)
+    result = subprocess.run([sys.executable, '-c', script], cwd=crashed, stdout=subprocess.DEVNULL)
+    assert result.returncode == 1
+    assert output_tree(crashed) != output_tree(clean)
+
+    extract(crashed, '--resume')
+    assert output_tree(crashed) == output_tree(clean)
+
+
+def test_second_resume_leaves_everything_alone(tmp_path):
+    # Copies of the repeated archive included, they go by the journal like every other output
+    directory = str(tmp_path)
+    make_tree(directory)
+    extract(directory, '--resume')
+    before = {path: os.stat(os.path.join(directory, 'system', path)).st_mtime_ns for path in output_tree(directory)}
+    output = extract(directory, '--resume')
+    assert 'Extracting:' not in output
+    assert output.count('Unchanged:') == len(before)
+    assert before == {path: os.stat(os.path.join(directory, 'system', path)).st_mtime_ns for path in output_tree(directory)}
@@ -0,0 +1,25 @@
+import struct
+
+from ALPHA_EATER import StringTable
+
+
+def test_name_info_reads_name_type_and_directories():
+    data = bytearray(64)
+    struct.pack_into('<III', data, 0x10, 0x30, 0x36, 0x3A)
+    data[0x30:0x40] = b'model\x00gmo\x00pc\x00\x00\x00\x00'
+    table = StringTable(bytes(data))
+    assert table.name_info(0x10, 3) == {'name': 'model', 'type': 'gmo', 'directories': ['pc']}
+
+
+def test_offset_name_past_the_end_gives_no_name():
+    # A broken entry only loses its name, it doesn't take the whole parse down
+    table = StringTable(bytes(100))
+    assert table.pointers(200, 3) == ()
+    assert table.pointers(98, 3) == ()
+    assert table.name_info(200, 3) == {'name': '', 'type': '', 'directories': []}
+
+
+def test_pointers_cut_at_the_end_of_the_file():
+    data = bytearray(24)
+    struct.pack_into('<II', data, 16, 5, 6)
+    assert StringTable(bytes(data)).pointers(16, 4) == (5, 6)